@@ -0,0 +1,60 @@
+from os import getenv
+
+# maximum amount of fastf1 sessions that are being loaded at the same time
+LOADER_MAX_WORKERS = int(getenv("F1DATA_LOADER_MAX_WORKERS", "4"))
+
+# approximate amount of memory the loaded sessions are allowed to occupy before
+# the least recently used ones are evicted from the session registry
+REGISTRY_MAX_BYTES = int(getenv("F1DATA_REGISTRY_MAX_BYTES", str(4 * 1024**3)))
+
+# sessions that took place within this amount of days are never evicted
+REGISTRY_PIN_RECENT_DAYS = int(getenv("F1DATA_REGISTRY_PIN_RECENT_DAYS", "14"))
+
+# memory each loaded session may use to cache the telemetry of individual laps
+LAP_TELEMETRY_CACHE_BYTES = int(getenv("F1DATA_LAP_TELEMETRY_CACHE_BYTES", str(64 * 1024**2)))
+
+# slice the telemetry of the laps of different drivers in parallel on the loader pool
+TELEMETRY_FAN_OUT = getenv("F1DATA_TELEMETRY_FAN_OUT", "0") == "1"
+
+# amount of points of the distance grid compared laps are resampled onto
+COMPARISON_GRID_POINTS = int(getenv("F1DATA_COMPARISON_GRID_POINTS", "1000"))
+
+# directory holding the livetiming files recorded with `python -m fastf1.livetiming save`,
+# live sessions can only be fed from files inside of it
+LIVE_TIMING_DIR = getenv("F1DATA_LIVE_TIMING_DIR", "livetiming")
+
+# minimum amount of seconds between two reloads of the livetiming files of a live session
+LIVE_REFRESH_SECONDS = float(getenv("F1DATA_LIVE_REFRESH_SECONDS", "5"))
+
+# memory the rendered responses may occupy in the response cache, compressed
+RESPONSE_CACHE_BYTES = int(getenv("F1DATA_RESPONSE_CACHE_BYTES", str(256 * 1024**2)))
+
+# directory the response cache keeps the responses of sessions that are not live in,
+# responses are only kept in memory when it is not set
+RESPONSE_CACHE_DIR = getenv("F1DATA_RESPONSE_CACHE_DIR") or None
+
+# responses smaller than this amount of bytes are sent without compression
+COMPRESSION_MIN_BYTES = int(getenv("F1DATA_COMPRESSION_MIN_BYTES", "1024"))
+
+# seconds the event schedule of the current season is cached for, schedules of
+# past seasons are cached until the application restarts
+SCHEDULE_TTL_SECONDS = float(getenv("F1DATA_SCHEDULE_TTL_SECONDS", "3600"))
+
+# warm the registry up with the sessions of the most recent weekends in the background
+PREFETCH_ENABLED = getenv("F1DATA_PREFETCH_ENABLED", "1") == "1"
+
+# amount of the most recent weekends whose sessions are prefetched
+PREFETCH_WEEKENDS = int(getenv("F1DATA_PREFETCH_WEEKENDS", "2"))
+
+# maximum amount of sessions the prefetcher loads at the same time
+PREFETCH_MAX_CONCURRENCY = int(getenv("F1DATA_PREFETCH_MAX_CONCURRENCY", "2"))
+
+# minutes after the start of a session its data is expected to be published
+PREFETCH_DELAY_MINUTES = float(getenv("F1DATA_PREFETCH_DELAY_MINUTES", "180"))
+
+# maximum amount of hours between two prefetches when no session is coming up
+PREFETCH_MAX_INTERVAL_HOURS = float(getenv("F1DATA_PREFETCH_MAX_INTERVAL_HOURS", "24"))
+
+# directory processed snapshots of the loaded sessions are kept in, sessions are always
+# loaded through fastf1 when it is empty
+SNAPSHOT_DIR = getenv("F1DATA_SNAPSHOT_DIR", "snapshots") or None
@@ -1,7 +1,7 @@
 from enum import StrEnum
-from typing import Literal
+from typing import Annotated, Literal
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class SessionIdentifier(StrEnum):
@@ -37,9 +37,28 @@ class TestingQueryRequest(BaseModel):
     round: str
     day: int 
 
+class TrackStatus(StrEnum):
+    GREEN = "1"
+    YELLOW = "2"
+    SAFETY_CAR = "4"
+    RED_FLAG = "5"
+    VIRTUAL_SAFETY_CAR = "6"
+    VIRTUAL_SAFETY_CAR_ENDING = "7"
+
+
 class SessionQuery(BaseModel):
     driver: str
     lap_filter: list[int] | None
+    # the filters below narrow the laps down further, laps have to match all of them
+    compounds: list[str] | None = None
+    stints: list[int] | None = None
+    min_tyre_life: int | None = None
+    max_tyre_life: int | None = None
+    flying_laps_only: bool = False
+    # laps slower than the personal best of the driver by at most this percentage
+    within_percent_of_best: Annotated[float, Field(ge=0)] | None = None
+    # laps during which the track status never left the given statuses
+    track_statuses: list[TrackStatus] | None = None
 
 class SessionQueryFilter(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -49,3 +68,20 @@ class SessionQueryFilter(BaseModel):
 class TelemetryRequest(BaseModel):
     driver: str
     lap_filter: list[int]
+
+
+class TelemetryChannel(StrEnum):
+    THROTTLE = "Throttle"
+    BRAKE = "Brake"
+    GEAR = "Gear"
+    SPEED = "Speed"
+    RPM = "RPM"
+    RELATIVE_DISTANCE = "RelativeDistance"
+    DISTANCE = "Distance"
+    TIME = "Time"
+
+
+class DownsamplingMode(StrEnum):
+    UNIFORM = "uniform"
+    LTTB = "lttb"
+    MINMAX = "minmax"
@@ -1,13 +1,35 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, logger
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+
+from core.config import COMPRESSION_MIN_BYTES, PREFETCH_ENABLED, SNAPSHOT_DIR
 
 from routers.monitoring import MonitoringRouter
 from routers.session_laps import SessionRouter
 from routers.session_results import SessionResults
 from routers.event import EventRouter
+from services.prefetcher.scheduler import prefetch_scheduler
+from services.session.executor import loader_executor
+from services.session.snapshot import snapshots_enabled
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    if SNAPSHOT_DIR is not None and not snapshots_enabled(SNAPSHOT_DIR):
+        logger.logger.warning(
+            "Session snapshots are disabled, pyarrow is not installed (F1DATA_SNAPSHOT_DIR=%s)",
+            SNAPSHOT_DIR,
+        )
+    if PREFETCH_ENABLED:
+        prefetch_scheduler.start()
+    yield
+    await prefetch_scheduler.stop()
+    loader_executor.shutdown()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +37,8 @@ app.add_middleware(
     allow_origins=["*"],
     allow_credentials=True,
 )
+# responses of the response cache are compressed already and passed through as they are
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
 app.include_router(SessionRouter)
 app.include_router(SessionResults)
 app.include_router(EventRouter)
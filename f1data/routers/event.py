@@ -1,31 +1,65 @@
+from datetime import date
+from functools import partial
 from typing import Annotated
-from fastapi import APIRouter, Path, Response
+from fastapi import APIRouter, Path, Request, Response
 from core.models.queries import SessionIdentifier
 from services.event_schedule.models import ScheduledEvent
-from services.event_schedule.event import get_schedule
+from services.event_schedule.event import get_cached_schedule
+from services.responses.cache import cached_response, entity_tag, not_modified
+from services.session.registry import RegistryKey
 from services.session_summary.models.summary import SessionSummary
 from services.session_summary.service import get_session_info
+from utils.encoding import JSON_MEDIA_TYPE, model_response
 
 
 EventRouter = APIRouter(prefix="/season", tags=["Event Schedule"])
 
 
+def _schedule_etag(request: Request, year: int) -> str | None:
+    # schedules of the seasons that are over do not change anymore
+    if year >= date.today().year:
+        return None
+    return entity_tag("schedule", request.url.path, year)
+
+
 @EventRouter.get("/{year}", response_model=list[ScheduledEvent])
 def year_events(
     year: Annotated[int, Path(title="Year")],
+    request: Request,
     response: Response
 ):
     response.headers['Cache-Control'] = 'max-age=4322600, public'
-    return get_schedule(year=year, backend="fastf1")
+    etag = _schedule_etag(request, year)
+    if etag is not None:
+        unmodified = not_modified(request, etag, response.headers)
+        if unmodified is not None:
+            return unmodified
+        response.headers["ETag"] = etag
+    return Response(
+        content=get_cached_schedule(year=year, backend="fastf1").body,
+        media_type=JSON_MEDIA_TYPE,
+        headers=dict(response.headers),
+    )
 
 
 @EventRouter.get("/{year}/telemetry", response_model=list[ScheduledEvent])
 def year_telemetry_events(
     year: Annotated[int, Path(title="Year", gt=2018)],
+    request: Request,
     response: Response
 ):
     response.headers['Cache-Control'] = 'max-age=4322600, public'
-    return get_schedule(year=year)
+    etag = _schedule_etag(request, year)
+    if etag is not None:
+        unmodified = not_modified(request, etag, response.headers)
+        if unmodified is not None:
+            return unmodified
+        response.headers["ETag"] = etag
+    return Response(
+        content=get_cached_schedule(year=year).body,
+        media_type=JSON_MEDIA_TYPE,
+        headers=dict(response.headers),
+    )
 
 
 @EventRouter.get(
@@ -36,14 +70,23 @@ async def get_session_summary(
     year: Annotated[int, Path(title="Year", gt=2018)],
     round_number: Annotated[str, Path(title="Round number")],
     session_identifier: Annotated[SessionIdentifier, Path(title="Session Identifier")],
+    request: Request,
     response: Response,
 ):
     response.headers["Cache-Control"] = "max-age=4322600, public"
-    return await get_session_info(
-        year=year,
-        round=int(round_number),
-        session_identifier=session_identifier,
-        is_testing=False,
+    return await cached_response(
+        request,
+        RegistryKey(str(year), int(round_number), session_identifier, False),
+        JSON_MEDIA_TYPE,
+        response.headers,
+        partial(
+            get_session_info,
+            year=year,
+            round=int(round_number),
+            session_identifier=session_identifier,
+            is_testing=False,
+        ),
+        partial(model_response, SessionSummary, headers=response.headers),
     )
 
 
@@ -55,12 +98,21 @@ async def get_testing_session_summary(
     year: Annotated[int, Path(title="Year", gt=2018)],
     testing_round: Annotated[str, Path(title="Testing round")],
     day: Annotated[int, Path(title='Testing day')],
+    request: Request,
     response: Response,
 ):
     response.headers["Cache-Control"] = "max-age=4322600, public"
-    return await get_session_info(
-        year=year,
-        round=int(testing_round),
-        session_identifier=day,
-        is_testing=True,
+    return await cached_response(
+        request,
+        RegistryKey(str(year), int(testing_round), day, True),
+        JSON_MEDIA_TYPE,
+        response.headers,
+        partial(
+            get_session_info,
+            year=year,
+            round=int(testing_round),
+            session_identifier=day,
+            is_testing=True,
+        ),
+        partial(model_response, SessionSummary, headers=response.headers),
     )
@@ -1,7 +1,14 @@
 
-from fastapi import APIRouter
+from pathlib import Path
 
+from fastapi import APIRouter, HTTPException
+
+from core.config import LIVE_TIMING_DIR
 from services.prefetcher.load_recent import prefetch_recent_events
+from services.responses.cache import response_cache
+from services.responses.models import ResponseCacheMetrics
+from services.session.models import LiveSession, RegistryMetrics
+from services.session.registry import RegistryKey, session_registry
 
 
 MonitoringRouter = APIRouter(prefix="/monitroing", tags=["Monitoring"])
@@ -10,4 +17,50 @@ MonitoringRouter = APIRouter(prefix="/monitroing", tags=["Monitoring"])
 async def fetch_recent_events():
     await prefetch_recent_events()
     return None
-    
\ No newline at end of file
+
+
+@MonitoringRouter.get('/registry', response_model=RegistryMetrics)
+def get_registry_metrics():
+    return session_registry.metrics()
+
+
+@MonitoringRouter.get('/responses', response_model=ResponseCacheMetrics)
+def get_response_cache_metrics():
+    return response_cache.metrics()
+
+
+def _live_timing_files(files: list[str]) -> list[str]:
+    directory = Path(LIVE_TIMING_DIR).resolve()
+    paths = [(directory / file).resolve() for file in files]
+    for file, path in zip(files, paths):
+        if not path.is_relative_to(directory) or not path.is_file():
+            raise HTTPException(status_code=400, detail=f"Unknown livetiming file {file}")
+    return [str(path) for path in paths]
+
+
+@MonitoringRouter.post('/live')
+def start_live_session(body: LiveSession):
+    """Serves the laps of the session from its livetiming files, that are reloaded
+    as the recorder appends to them. The session is kept loaded until it is stopped"""
+    if not body.files:
+        raise HTTPException(status_code=400, detail="No livetiming files given")
+
+    files = _live_timing_files(body.files)
+    key = RegistryKey(body.year, body.round, body.session_identifier, body.is_testing)
+    session_registry.pin(key)
+    session_registry.get(key).enable_live(files)
+    # responses cached before are rendered from the data of the API
+    response_cache.invalidate(key)
+    return None
+
+
+@MonitoringRouter.post('/live/stop')
+def stop_live_session(body: LiveSession):
+    key = RegistryKey(body.year, body.round, body.session_identifier, body.is_testing)
+    loader = session_registry.find(key)
+    if loader is not None:
+        loader.disable_live()
+    session_registry.unpin(key)
+    # responses cached during the session are rendered from the partial live data
+    response_cache.invalidate(key)
+    return None
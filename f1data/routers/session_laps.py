@@ -1,9 +1,21 @@
-from fastapi import APIRouter, Response
+from functools import partial
+from typing import Annotated
+from fastapi import APIRouter, Query, Request, Response
 
 
-from core.models.queries import SessionIdentifier, SessionQueryFilter, TelemetryRequest
+from core.models.queries import (
+    DownsamplingMode,
+    SessionIdentifier,
+    SessionQueryFilter,
+    TelemetryChannel,
+    TelemetryRequest,
+)
+from services.laps.analytics import DEFAULT_FUEL_CORRECTION, get_pace_analytics
+from services.laps.models.analytics import PaceAnalyticsData
 from services.laps.models.laps import LapSelectionData
 from services.laps.resolver import get_resolved_laptime_data
+from services.responses.cache import cached_response, canonical_queries
+from services.session.registry import RegistryKey, is_live_session
 from services.tasks.preload_telemetry import preload_telemetry
 from services.telemetry.models.Telemetry import DriverTelemetryData, TelemetryComparison
 from services.telemetry.resolver import (
@@ -11,6 +23,12 @@ from services.telemetry.resolver import (
     get_telemetries,
     get_telemetry,
 )
+from utils.encoding import (
+    JSON_MEDIA_TYPE,
+    encode_response,
+    json_response,
+    response_media_type,
+)
 from fastapi import BackgroundTasks
 
 SessionRouter = APIRouter(tags=["Session level data"])
@@ -25,22 +43,83 @@ async def get_session_laptimes(
     round_number: str,
     session_identifier: SessionIdentifier,
     body: SessionQueryFilter,
+    request: Request,
     response: Response,
     background_tasks: BackgroundTasks,
+    since_version: Annotated[int | None, Query(ge=0)] = None,
 ):
     """
-    Retrieve laptime data for given session
+    Retrieve laptime data for given session.
+
+    With `since_version`, the `data_version` of an earlier response, only the laps
+    completed or whose flags changed since are returned, statistics always cover every lap
     """
     background_tasks.add_task(
         preload_telemetry, year, round_number, session_identifier, is_testing=False
     )
-    response.headers["Cache-Control"] = "public, max-age=604800"
-    return await get_resolved_laptime_data(
-        year=year,
-        round_number=int(round_number),
-        session_identifier=session_identifier,
-        queries=body.queries,
-        is_testing=False,
+    # laps of live sessions change with every refresh
+    response.headers["Cache-Control"] = (
+        "no-cache"
+        if is_live_session(year, int(round_number), session_identifier, is_testing=False)
+        else "public, max-age=604800"
+    )
+    return await cached_response(
+        request,
+        RegistryKey(year, int(round_number), session_identifier, False),
+        JSON_MEDIA_TYPE,
+        response.headers,
+        partial(
+            get_resolved_laptime_data,
+            year=year,
+            round_number=int(round_number),
+            session_identifier=session_identifier,
+            queries=body.queries,
+            is_testing=False,
+            since_version=since_version,
+        ),
+        partial(json_response, headers=response.headers),
+        body=canonical_queries(body.queries),
+    )
+
+
+@SessionRouter.post(
+    "/season/{year}/round/{round_number}/session/{session_identifier}/laps/analytics",
+    response_model=PaceAnalyticsData,
+)
+async def get_session_pace_analytics(
+    year: str,
+    round_number: str,
+    session_identifier: SessionIdentifier,
+    body: SessionQueryFilter,
+    request: Request,
+    response: Response,
+    fuel_correction: Annotated[float, Query(ge=0)] = DEFAULT_FUEL_CORRECTION,
+):
+    """
+    Retrieve degradation fits and fuel corrected pace of every stint, computed over the
+    flying laps matching the queries. `fuel_correction` is the time a lap of fuel costs
+    """
+    response.headers["Cache-Control"] = (
+        "no-cache"
+        if is_live_session(year, int(round_number), session_identifier, is_testing=False)
+        else "public, max-age=604800"
+    )
+    return await cached_response(
+        request,
+        RegistryKey(year, int(round_number), session_identifier, False),
+        JSON_MEDIA_TYPE,
+        response.headers,
+        partial(
+            get_pace_analytics,
+            year=year,
+            round_number=int(round_number),
+            session_identifier=session_identifier,
+            queries=body.queries,
+            fuel_correction=fuel_correction,
+            is_testing=False,
+        ),
+        partial(json_response, headers=response.headers),
+        body=canonical_queries(body.queries),
     )
 
 
@@ -53,15 +132,49 @@ async def get_session_telemetry(
     round_number: str,
     session_identifier: SessionIdentifier,
     body: list[TelemetryRequest],
+    request: Request,
+    response: Response,
+    minisectors: Annotated[int | None, Query(gt=0)] = None,
+    points: Annotated[int | None, Query(ge=4)] = None,
+    downsampling: DownsamplingMode = DownsamplingMode.UNIFORM,
+    reference_driver: str | None = None,
+    reference_lap: Annotated[int | None, Query(ge=1)] = None,
 ):
-    return await get_interpolated_telemetry_comparison(
-        year, int(round_number), session_identifier, body, is_testing=False
+    """
+    Compare the selected laps with a reference lap, the fastest of them by default.
+
+    `reference_driver` and `reference_lap` pick the reference among the selected laps,
+    with a driver alone the fastest selected lap of that driver is the reference
+    """
+    response.headers["Vary"] = "Accept"
+    accept = request.headers.get("accept")
+    return await cached_response(
+        request,
+        RegistryKey(year, int(round_number), session_identifier, False),
+        response_media_type(accept),
+        response.headers,
+        partial(
+            get_interpolated_telemetry_comparison,
+            year,
+            int(round_number),
+            session_identifier,
+            body,
+            is_testing=False,
+            minisectors=minisectors,
+            points=points,
+            mode=downsampling,
+            reference_driver=reference_driver,
+            reference_lap=reference_lap,
+        ),
+        lambda payload: encode_response(accept, payload, response.headers),
+        body=[query.model_dump(mode="json") for query in body],
     )
 
 
 @SessionRouter.get(
     "/season/{year}/round/{round_number}/session/{session_identifier}/lap/{lap}/driver/{driver}/telemetry",
     response_model=DriverTelemetryData,
+    response_model_exclude_none=True,
 )
 async def get_session_lap_driver_telemetry(
     year: str,
@@ -69,30 +182,72 @@ async def get_session_lap_driver_telemetry(
     session_identifier: SessionIdentifier,
     lap: str,
     driver: str,
+    request: Request,
     response: Response,
+    channels: Annotated[list[TelemetryChannel] | None, Query()] = None,
+    points: Annotated[int | None, Query(ge=4)] = None,
+    downsampling: DownsamplingMode = DownsamplingMode.UNIFORM,
 ):
     response.headers["Cache-Control"] = "public, max-age=604800"
-    return await get_telemetry(
-        year, int(round_number), session_identifier, driver, lap, is_testing=False
+    response.headers["Vary"] = "Accept"
+    accept = request.headers.get("accept")
+    return await cached_response(
+        request,
+        RegistryKey(year, int(round_number), session_identifier, False),
+        response_media_type(accept, tabular=True),
+        response.headers,
+        partial(
+            get_telemetry,
+            year,
+            int(round_number),
+            session_identifier,
+            driver,
+            lap,
+            is_testing=False,
+            channels=channels,
+            points=points,
+            mode=downsampling,
+        ),
+        lambda payload: encode_response(accept, payload, response.headers, tabular=True),
     )
 
 
 @SessionRouter.post(
     "/season/{year}/round/{round_number}/session/{session_identifier}/telemetries",
     response_model=list[DriverTelemetryData],
+    response_model_exclude_none=True,
 )
 async def get_session_lap_telemetries(
     year: str,
     round_number: str,
     session_identifier: SessionIdentifier,
     body: list[TelemetryRequest],
+    request: Request,
+    response: Response,
+    channels: Annotated[list[TelemetryChannel] | None, Query()] = None,
+    points: Annotated[int | None, Query(ge=4)] = None,
+    downsampling: DownsamplingMode = DownsamplingMode.UNIFORM,
 ):
-    return await get_telemetries(
-        year=year,
-        round_number=int(round_number),
-        session_identifier=session_identifier,
-        queries=body,
-        is_testing=False,
+    response.headers["Vary"] = "Accept"
+    accept = request.headers.get("accept")
+    return await cached_response(
+        request,
+        RegistryKey(year, int(round_number), session_identifier, False),
+        response_media_type(accept, tabular=True),
+        response.headers,
+        partial(
+            get_telemetries,
+            year=year,
+            round_number=int(round_number),
+            session_identifier=session_identifier,
+            queries=body,
+            is_testing=False,
+            channels=channels,
+            points=points,
+            mode=downsampling,
+        ),
+        lambda payload: encode_response(accept, payload, response.headers, tabular=True),
+        body=[query.model_dump(mode="json") for query in body],
     )
 
 
@@ -105,22 +260,83 @@ async def get_testing_session_laptimes(
     round_number: str,
     day: int,
     body: SessionQueryFilter,
+    request: Request,
     response: Response,
     background_tasks: BackgroundTasks,
+    since_version: Annotated[int | None, Query(ge=0)] = None,
 ):
     """
-    Retrieve laptime data for given session
+    Retrieve laptime data for given session.
+
+    With `since_version`, the `data_version` of an earlier response, only the laps
+    completed or whose flags changed since are returned, statistics always cover every lap
     """
     background_tasks.add_task(
         preload_telemetry, year, round_number, day, is_testing=True
     )
-    response.headers["Cache-Control"] = "public, max-age=604800"
-    return await get_resolved_laptime_data(
-        year=year,
-        round_number=int(round_number),
-        session_identifier=day,
-        queries=body.queries,
-        is_testing=True,
+    # laps of live sessions change with every refresh
+    response.headers["Cache-Control"] = (
+        "no-cache"
+        if is_live_session(year, int(round_number), day, is_testing=True)
+        else "public, max-age=604800"
+    )
+    return await cached_response(
+        request,
+        RegistryKey(year, int(round_number), day, True),
+        JSON_MEDIA_TYPE,
+        response.headers,
+        partial(
+            get_resolved_laptime_data,
+            year=year,
+            round_number=int(round_number),
+            session_identifier=day,
+            queries=body.queries,
+            is_testing=True,
+            since_version=since_version,
+        ),
+        partial(json_response, headers=response.headers),
+        body=canonical_queries(body.queries),
+    )
+
+
+@SessionRouter.post(
+    "/season/{year}/testing_round/{round_number}/day/{day}/laps/analytics",
+    response_model=PaceAnalyticsData,
+)
+async def get_testing_session_pace_analytics(
+    year: str,
+    round_number: str,
+    day: int,
+    body: SessionQueryFilter,
+    request: Request,
+    response: Response,
+    fuel_correction: Annotated[float, Query(ge=0)] = DEFAULT_FUEL_CORRECTION,
+):
+    """
+    Retrieve degradation fits and fuel corrected pace of every stint, computed over the
+    flying laps matching the queries. `fuel_correction` is the time a lap of fuel costs
+    """
+    response.headers["Cache-Control"] = (
+        "no-cache"
+        if is_live_session(year, int(round_number), day, is_testing=True)
+        else "public, max-age=604800"
+    )
+    return await cached_response(
+        request,
+        RegistryKey(year, int(round_number), day, True),
+        JSON_MEDIA_TYPE,
+        response.headers,
+        partial(
+            get_pace_analytics,
+            year=year,
+            round_number=int(round_number),
+            session_identifier=day,
+            queries=body.queries,
+            fuel_correction=fuel_correction,
+            is_testing=True,
+        ),
+        partial(json_response, headers=response.headers),
+        body=canonical_queries(body.queries),
     )
 
 
@@ -133,19 +349,49 @@ async def get_testing_session_telemetry(
     round_number: str,
     day: int,
     body: list[TelemetryRequest],
+    request: Request,
+    response: Response,
+    minisectors: Annotated[int | None, Query(gt=0)] = None,
+    points: Annotated[int | None, Query(ge=4)] = None,
+    downsampling: DownsamplingMode = DownsamplingMode.UNIFORM,
+    reference_driver: str | None = None,
+    reference_lap: Annotated[int | None, Query(ge=1)] = None,
 ):
-    return await get_interpolated_telemetry_comparison(
-        year=year,
-        round_number=int(round_number),
-        session_identifier=day,
-        comparison=body,
-        is_testing=True,
+    """
+    Compare the selected laps with a reference lap, the fastest of them by default.
+
+    `reference_driver` and `reference_lap` pick the reference among the selected laps,
+    with a driver alone the fastest selected lap of that driver is the reference
+    """
+    response.headers["Vary"] = "Accept"
+    accept = request.headers.get("accept")
+    return await cached_response(
+        request,
+        RegistryKey(year, int(round_number), day, True),
+        response_media_type(accept),
+        response.headers,
+        partial(
+            get_interpolated_telemetry_comparison,
+            year=year,
+            round_number=int(round_number),
+            session_identifier=day,
+            comparison=body,
+            is_testing=True,
+            minisectors=minisectors,
+            points=points,
+            mode=downsampling,
+            reference_driver=reference_driver,
+            reference_lap=reference_lap,
+        ),
+        lambda payload: encode_response(accept, payload, response.headers),
+        body=[query.model_dump(mode="json") for query in body],
     )
 
 
 @SessionRouter.get(
     "/season/{year}/testing_round/{round_number}/day/{day}/lap/{lap}/driver/{driver}/telemetry",
     response_model=DriverTelemetryData,
+    response_model_exclude_none=True,
 )
 async def get_testing_session_lap_driver_telemetry(
     year: str,
@@ -153,33 +399,70 @@ async def get_testing_session_lap_driver_telemetry(
     day: int,
     lap: str,
     driver: str,
+    request: Request,
     response: Response,
+    channels: Annotated[list[TelemetryChannel] | None, Query()] = None,
+    points: Annotated[int | None, Query(ge=4)] = None,
+    downsampling: DownsamplingMode = DownsamplingMode.UNIFORM,
 ):
     response.headers["Cache-Control"] = "public, max-age=604800"
-    return await get_telemetry(
-        year=year,
-        round_number=int(round_number),
-        session_identifier=day,
-        driver=driver,
-        lap=lap,
-        is_testing=True,
+    response.headers["Vary"] = "Accept"
+    accept = request.headers.get("accept")
+    return await cached_response(
+        request,
+        RegistryKey(year, int(round_number), day, True),
+        response_media_type(accept, tabular=True),
+        response.headers,
+        partial(
+            get_telemetry,
+            year=year,
+            round_number=int(round_number),
+            session_identifier=day,
+            driver=driver,
+            lap=lap,
+            is_testing=True,
+            channels=channels,
+            points=points,
+            mode=downsampling,
+        ),
+        lambda payload: encode_response(accept, payload, response.headers, tabular=True),
     )
 
 
 @SessionRouter.post(
     "/season/{year}/testing_round/{round_number}/day/{day}/telemetries",
     response_model=list[DriverTelemetryData],
+    response_model_exclude_none=True,
 )
 async def get_testing_session_lap_telemetries(
     year: str,
     round_number: str,
     day: int,
     body: list[TelemetryRequest],
+    request: Request,
+    response: Response,
+    channels: Annotated[list[TelemetryChannel] | None, Query()] = None,
+    points: Annotated[int | None, Query(ge=4)] = None,
+    downsampling: DownsamplingMode = DownsamplingMode.UNIFORM,
 ):
-    return await get_telemetries(
-        year=year,
-        round_number=int(round_number),
-        session_identifier=day,
-        queries=body,
-        is_testing=True,
+    response.headers["Vary"] = "Accept"
+    accept = request.headers.get("accept")
+    return await cached_response(
+        request,
+        RegistryKey(year, int(round_number), day, True),
+        response_media_type(accept, tabular=True),
+        response.headers,
+        partial(
+            get_telemetries,
+            year=year,
+            round_number=int(round_number),
+            session_identifier=day,
+            queries=body,
+            is_testing=True,
+            channels=channels,
+            points=points,
+            mode=downsampling,
+        ),
+        lambda payload: encode_response(accept, payload, response.headers, tabular=True),
+        body=[query.model_dump(mode="json") for query in body],
     )
@@ -1,5 +1,6 @@
+from functools import partial
 from typing import Annotated
-from fastapi import APIRouter, Depends 
+from fastapi import APIRouter, Depends, Request, Response
 
 from core.models.queries import (
     QualiQueryRequest,
@@ -8,7 +9,10 @@ from core.models.queries import (
     TestingQueryRequest,
 )
 from services.results.models.results import PracticeResult, QualifyingResult, RaceResult
+from services.responses.cache import cached_response
 from services.results.resolver import get_results
+from services.session.registry import RegistryKey
+from utils.encoding import JSON_MEDIA_TYPE, model_response
 
 SessionResults = APIRouter(prefix="/session/results", tags=["SessionData"])
 
@@ -16,42 +20,82 @@ SessionResults = APIRouter(prefix="/session/results", tags=["SessionData"])
 @SessionResults.get("/practice", response_model=list[PracticeResult])
 async def get_practice_results(
     params: Annotated[PracticeQueryRequest, Depends()],
+    request: Request,
+    response: Response,
 ):
-    return await get_results(
-        year=params.year,
-        session_identifier=params.type,
-        round=int(params.round),
+    return await cached_response(
+        request,
+        RegistryKey(params.year, int(params.round), params.type, False),
+        JSON_MEDIA_TYPE,
+        response.headers,
+        partial(
+            get_results,
+            year=params.year,
+            session_identifier=params.type,
+            round=int(params.round),
+        ),
+        partial(model_response, list[PracticeResult], headers=response.headers),
     )
 
 
 @SessionResults.get("/racelike", response_model=list[RaceResult])
 async def get_racelike_results(
     params: Annotated[RaceQueryRequest, Depends()],
+    request: Request,
+    response: Response,
 ):
-    return await get_results(
-        year=params.year,
-        session_identifier=params.type,
-        round=int(params.round),
+    return await cached_response(
+        request,
+        RegistryKey(params.year, int(params.round), params.type, False),
+        JSON_MEDIA_TYPE,
+        response.headers,
+        partial(
+            get_results,
+            year=params.year,
+            session_identifier=params.type,
+            round=int(params.round),
+        ),
+        partial(model_response, list[RaceResult], headers=response.headers),
     )
 
 
 @SessionResults.get("/qualilike", response_model=list[QualifyingResult])
 async def get_qualifying_results(
     params: Annotated[QualiQueryRequest, Depends()],
+    request: Request,
+    response: Response,
 ):
-    return await get_results(
-        year=params.year,
-        session_identifier=params.type,
-        round=int(params.round),
+    return await cached_response(
+        request,
+        RegistryKey(params.year, int(params.round), params.type, False),
+        JSON_MEDIA_TYPE,
+        response.headers,
+        partial(
+            get_results,
+            year=params.year,
+            session_identifier=params.type,
+            round=int(params.round),
+        ),
+        partial(model_response, list[QualifyingResult], headers=response.headers),
     )
 
 @SessionResults.get("/testing", response_model=list[PracticeResult])
 async def get_testing_results(
     params: Annotated[TestingQueryRequest, Depends()],
+    request: Request,
+    response: Response,
 ):
-    return await get_results(
-        year=params.year,
-        session_identifier=params.day,
-        round=int(params.round),
-        is_testing=True
+    return await cached_response(
+        request,
+        RegistryKey(params.year, int(params.round), params.day, True),
+        JSON_MEDIA_TYPE,
+        response.headers,
+        partial(
+            get_results,
+            year=params.year,
+            session_identifier=params.day,
+            round=int(params.round),
+            is_testing=True,
+        ),
+        partial(model_response, list[PracticeResult], headers=response.headers),
     )
\ No newline at end of file
@@ -1,10 +1,71 @@
-from typing import Literal, Optional
+from datetime import date
+from threading import Lock
+from time import monotonic
+from typing import Any, Literal, NamedTuple, Optional
+
 import fastf1
 from pycountry import countries
 
+from core.config import SCHEDULE_TTL_SECONDS
+from services.event_schedule.models import ScheduledEvent
+from utils.encoding import encode_model
+
+ScheduleBackend = Optional[Literal["fastf1", "f1timing", "ergast"]]
+
+# alpha-2 codes by lowercase country name, the lookup `countries.get(name=...)` does
+_COUNTRY_CODES = {country.name.lower(): country.alpha_2 for country in countries}
+
+
+class Schedule(NamedTuple):
+    records: list[dict[str, Any]]
+    # the records rendered as a list of `ScheduledEvent`
+    body: bytes
+    fetched_at: float
+
+
+_schedules: dict[tuple[int, ScheduleBackend], Schedule] = {}
+_schedule_locks: dict[tuple[int, ScheduleBackend], Lock] = {}
+_lock = Lock()
+
 
-def get_schedule(year: int, backend: Optional[Literal["fastf1", "f1timing", "ergast"]] = None):
+def _fetch_schedule(year: int, backend: ScheduleBackend) -> Schedule:
     event_schedule = fastf1.get_event_schedule(year=year, backend=backend)
-    event_schedule['Country'] = event_schedule['Country'].map(lambda x: countries.get(name=x).alpha_2 if countries.get(name=x) is not None else x)
+    event_schedule['Country'] = (
+        event_schedule['Country']
+        .str.lower()
+        .map(_COUNTRY_CODES)
+        .fillna(event_schedule['Country'])
+    )
+
+    records = event_schedule.to_dict(orient='records')
+    return Schedule(records, encode_model(list[ScheduledEvent], records), monotonic())
+
+
+def _is_fresh(year: int, schedule: Schedule | None) -> bool:
+    if schedule is None:
+        return False
+    # schedules of the seasons that are over do not change anymore
+    return year < date.today().year or monotonic() - schedule.fetched_at < SCHEDULE_TTL_SECONDS
+
+
+def get_cached_schedule(year: int, backend: ScheduleBackend = None) -> Schedule:
+    """Event schedule of the season, fetched once per backend. The schedule of the current
+    season is fetched again once it is older than `SCHEDULE_TTL_SECONDS`"""
+    key = (year, backend)
+    schedule = _schedules.get(key)
+    if _is_fresh(year, schedule):
+        return schedule
+
+    with _lock:
+        key_lock = _schedule_locks.setdefault(key, Lock())
+    # concurrent requests of a schedule wait for a single fetch
+    with key_lock:
+        schedule = _schedules.get(key)
+        if not _is_fresh(year, schedule):
+            schedule = _fetch_schedule(year, backend)
+            _schedules[key] = schedule
+        return schedule
+
 
-    return event_schedule.to_dict(orient='records')
\ No newline at end of file
+def get_schedule(year: int, backend: ScheduleBackend = None) -> list[dict[str, Any]]:
+    return get_cached_schedule(year, backend).records
@@ -0,0 +1,155 @@
+from typing import Any
+
+from numpy import (
+    bincount,
+    concatenate,
+    errstate,
+    float64,
+    full,
+    inf,
+    int64,
+    intp,
+    maximum,
+    minimum,
+    nan,
+    ravel_multi_index,
+    unique,
+    where,
+)
+from pandas import DataFrame, factorize
+
+from core.models.queries import SessionIdentifier, SessionQuery
+from services.laps.resolver import get_lap_table
+from services.laps.serialization import STINT_PACE_FIELDS, serialize_records
+from services.laps.table import LapTable
+from services.session.registry import get_loader
+from services.session.session import SessionLoader
+
+# seconds a lap of fuel costs, about 1.7 kg of fuel at roughly 0.035 seconds per kg
+DEFAULT_FUEL_CORRECTION = 0.06
+
+# sums of squared tyre life deviations below this are treated as a single tyre age
+_MIN_TYRE_LIFE_SPREAD = 1e-9
+
+
+def stint_pace(
+    laps: DataFrame, fuel_correction: float, race_laps: float
+) -> tuple[list[tuple[str, str]], DataFrame]:
+    """Linear fits of the fuel corrected lap times of every stint over tyre life.
+
+    The least squares fits of all stints are solved at once from the per stint sums.
+    Returns the driver and team of every stint in sorted order along with its fit"""
+    laps = laps[
+        laps[["Driver", "Team", "Stint", "TyreLife", "LapTime"]].notna().all(axis=1)
+    ]
+    codes, levels = zip(
+        *(factorize(laps[key], sort=True) for key in ("Driver", "Team", "Stint"))
+    )
+    _, first, group = unique(
+        ravel_multi_index(codes, [max(len(level), 1) for level in levels]),
+        return_index=True,
+        return_inverse=True,
+    )
+    stints = len(first)
+
+    seconds = laps["LapTime"].to_numpy().view(int64) / 1e9
+    lap_numbers = laps["LapNumber"].to_numpy(dtype=float64)
+    # lap times are corrected to the weight of the car at the end of the session
+    corrected = seconds - fuel_correction * (race_laps - lap_numbers)
+    tyre_life = laps["TyreLife"].to_numpy(dtype=float64)
+
+    # sums are taken over the deviations from the overall means to keep them well conditioned
+    x_offset = tyre_life.mean() if len(tyre_life) else 0.0
+    y_offset = corrected.mean() if len(corrected) else 0.0
+    x, y = tyre_life - x_offset, corrected - y_offset
+
+    def sums(weights=None):
+        return bincount(group, weights=weights, minlength=stints).astype(float64)
+
+    count, sum_x, sum_y = sums(), sums(x), sums(y)
+    with errstate(divide="ignore", invalid="ignore"):
+        sxx = sums(x * x) - sum_x * sum_x / count
+        sxy = sums(x * y) - sum_x * sum_y / count
+        syy = sums(y * y) - sum_y * sum_y / count
+        spread = sxx > _MIN_TYRE_LIFE_SPREAD
+        degradation = where(spread, sxy / sxx, nan)
+        intercept = sum_y / count + y_offset - degradation * (sum_x / count + x_offset)
+        r_squared = where(spread & (syy > 0), sxy * sxy / (sxx * syy), nan)
+
+    first_lap = full(stints, inf)
+    last_lap = full(stints, -inf)
+    minimum.at(first_lap, group, lap_numbers)
+    maximum.at(last_lap, group, lap_numbers)
+
+    driver_codes, team_codes, stint_codes = (code[first] for code in codes)
+    keys = [
+        (levels[0][driver], levels[1][team])
+        for driver, team in zip(driver_codes, team_codes)
+    ]
+    return keys, DataFrame(
+        {
+            "stint": levels[2][stint_codes],
+            "compound": laps["Compound"].to_numpy()[first],
+            "total_laps": count,
+            "first_lap": first_lap,
+            "last_lap": last_lap,
+            "avg_time": sums(seconds) / count,
+            "fuel_corrected_time": sum_y / count + y_offset,
+            "degradation": degradation,
+            "intercept": intercept,
+            "r_squared": r_squared,
+        }
+    )
+
+
+def _resolve_pace_data(
+    loader: SessionLoader,
+    lap_table: LapTable,
+    queries: list[SessionQuery],
+    fuel_correction: float,
+) -> dict[str, Any]:
+    """Resolves the stint fits of the flying laps matching the queries,
+    serialized in the shape of `PaceAnalyticsData`"""
+    selections = lap_table.select(queries)
+    positions = concatenate(
+        [selection.positions for selection in selections] or [[]]
+    ).astype(intp)
+    laps = lap_table.laps.iloc[positions]
+    # the scheduled distance does not move as the laps of live sessions come in, sessions
+    # without one are corrected to the last lap that was completed
+    keys, stints = stint_pace(
+        laps[laps["IsFlyingLap"]],
+        fuel_correction,
+        race_laps=loader.total_laps or lap_table.laps["LapNumber"].max(),
+    )
+
+    stint_records: dict[tuple[str, str], list[dict[str, Any]]] = {}
+    for key, record in zip(keys, serialize_records(stints, STINT_PACE_FIELDS)):
+        stint_records.setdefault(key, []).append(record)
+
+    driver_pace_data = []
+    for selection in sorted(selections, key=lambda selection: selection.statistics.min_time):
+        style = loader.get_driver_style(selection.driver)
+        driver_pace_data.append(
+            {
+                "driver": selection.driver,
+                "team": selection.team,
+                "color": style["Color"],
+                "alternative_style": style["IsDashed"],
+                "stints": stint_records.get((selection.driver, selection.team), []),
+            }
+        )
+
+    return {"fuel_correction": fuel_correction, "driver_pace_data": driver_pace_data}
+
+
+async def get_pace_analytics(
+    year: str,
+    round_number: int,
+    session_identifier: SessionIdentifier | int,
+    queries: list[SessionQuery],
+    fuel_correction: float = DEFAULT_FUEL_CORRECTION,
+    is_testing: bool = False,
+) -> dict[str, Any]:
+    loader = get_loader(year=year, round=round_number, session_identifier=session_identifier, is_testing=is_testing)
+    return _resolve_pace_data(loader, await get_lap_table(loader), queries, fuel_correction)
@@ -0,0 +1,34 @@
+from pydantic import BaseModel
+
+from services.laps.models.laps import ECompound
+
+
+class StintPaceData(BaseModel):
+    stint: int
+    compound: ECompound | None
+    total_laps: int
+    first_lap: int
+    last_lap: int
+    # mean lap time of the stint, in seconds
+    avg_time: float
+    # mean lap time of the stint corrected to an empty fuel tank, in seconds
+    fuel_corrected_time: float
+    # slope of the fuel corrected lap time over tyre life, in seconds per lap
+    degradation: float | None
+    # fuel corrected lap time on tyres of no age, in seconds
+    intercept: float | None
+    r_squared: float | None
+
+
+class DriverPaceData(BaseModel):
+    driver: str
+    team: str
+    color: str
+    alternative_style: bool
+    stints: list[StintPaceData]
+
+
+class PaceAnalyticsData(BaseModel):
+    # seconds every remaining lap of fuel is assumed to cost
+    fuel_correction: float
+    driver_pace_data: list[DriverPaceData]
@@ -114,6 +114,8 @@ class LapSelectionData(BaseModel):
     high_decile: Timedelta
     min_time: Timedelta
     max_time: Timedelta
+    # cursor of the laps, passed as `since_version` to only receive the laps changed after it
+    data_version: int
 
     @field_serializer(
         "low_decile",
@@ -1,176 +1,82 @@
-from pandas import DataFrame, NamedAgg, isna, concat
-from fastf1.core import Laps, Session 
+from asyncio import Future, ensure_future, shield
+from functools import partial
+
+from fastf1.core import Laps
 
 from core.models.queries import SessionIdentifier, SessionQuery
-from services.laps.models.laps import DriverLapData, LapSelectionData, StintData
+from services.laps.table import LapTable
+from services.session.executor import loader_executor
 from services.session.registry import get_loader
-from utils.get_driver_color import get_driver_style
-
-
-def _populate_with_data(laps: DataFrame):
-    return laps.assign(
-        IsOutlap=isna(laps["Sector1Time"]),
-        IsInlap=isna(laps["Sector3Time"]),
-        IsFlyingLap=(laps["PitInTime"].isna() & laps["PitOutTime"].isna()),
-    )
+from services.session.session import SessionLoader
 
 
-def _rename_sector_columns(laps: DataFrame):
-    laps.rename(
-        columns={"SpeedI1": "ST1", "SpeedI2": "ST2", "SpeedFL": "ST3"}, inplace=True
+def _build_lap_table(loader: SessionLoader, laps: Laps, data_version: int) -> Future:
+    future = ensure_future(
+        loader_executor.run(
+            loader, ("lap_table", data_version), partial(LapTable, laps, data_version)
+        )
     )
-    return laps
-
-
-def _fix_floating_point_precision(laps: DataFrame):
-    laps[["LapTime", "Sector1Time", "Sector2Time", "Sector3Time"]].round(3)
-
-
-def _set_purple_sectors(laps: DataFrame):
-    purple_s1 = laps["Sector1Time"].min()
-    purple_s2 = laps["Sector2Time"].min()
-    purple_s3 = laps["Sector3Time"].min()
-
-    laps["IsBestS1"] = laps["Sector1Time"] == purple_s1
-    laps["IsBestS2"] = laps["Sector2Time"] == purple_s2
-    laps["IsBestS3"] = laps["Sector3Time"] == purple_s3
-
-
-def _set_purple_speedtraps(laps: DataFrame):
-    st1_max = laps["ST1"].max()
-    st2_max = laps["ST2"].max()
-    st3_max = laps["ST3"].max()
-
-    laps["IsBestST1"] = laps["ST1"] == st1_max
-    laps["IsBestST2"] = laps["ST2"] == st2_max
-    laps["IsBestST3"] = laps["ST3"] == st3_max
-
-
-def _set_is_personal_best_sector(laps: DataFrame):
-    pb_s1 = laps.groupby("Driver")["Sector1Time"].min()
-    pb_s2 = laps.groupby("Driver")["Sector2Time"].min()
-    pb_s3 = laps.groupby("Driver")["Sector3Time"].min()
-
-    for driver, laptime in pb_s1.items():
-        sector_times = laps[laps["Driver"] == driver]["Sector1Time"]
-        laps.loc[laps["Driver"] == driver, "IsPBS1"] = sector_times == laptime
 
-    for driver, laptime in pb_s2.items():
-        sector_times = laps[laps["Driver"] == driver]["Sector2Time"]
-        laps.loc[laps["Driver"] == driver, "IsPBS2"] = sector_times == laptime
-
-    for driver, laptime in pb_s3.items():
-        sector_times = laps[laps["Driver"] == driver]["Sector3Time"]
-        laps.loc[laps["Driver"] == driver, "IsPBS3"] = sector_times == laptime
-
-
-def _set_is_personal_best(laps: DataFrame):
-    # this personal best returns actual personal best laptime across
-    # the whole session, unlike the built in `IsPersonalBest` attribute
-    # that returns "rolling" personal best, i.e. the personal best at that point in time
-    # which means that there are multiple personal bests in the same session
-    personal_best_laps = laps.groupby("Driver")["LapTime"].min()
-    for driver, laptime in personal_best_laps.items():
-        current_driver_laptimes = laps[laps["Driver"] == driver]["LapTime"]
-        laps.loc[laps["Driver"] == driver, "IsPB"] = laptime == current_driver_laptimes
-
-    return laps
-
-
-def _filter_session(laps: Laps, queries: list[SessionQuery]) -> Laps:
-    return concat(
-        [
-            (
-                laps.pick_drivers(query.driver).pick_laps(query.lap_filter)
-                if query.lap_filter
-                else laps.pick_drivers(query.driver)
-            )
-            for query in queries
-        ]
-    )  # type: ignore
+    def built(future: Future) -> None:
+        # the build is dropped when the loader discarded its data in the meantime
+        if loader.pending_lap_table is not future:
+            return
+        loader.pending_lap_table = None
+        if not future.cancelled() and future.exception() is None:
+            loader.lap_table = future.result()
+
+    future.add_done_callback(built)
+    return future
+
+
+async def get_lap_table(loader: SessionLoader) -> LapTable:
+    await loader.refresh()
+    # read before the laps, a reload finishing in between is ingested by the next request
+    data_version = loader.data_version
+    laps = await loader.laps
+    lap_table = loader.lap_table
+    if lap_table is None:
+        # concurrent requests on a cold session share a single build
+        if loader.pending_lap_table is None:
+            loader.pending_lap_table = _build_lap_table(loader, laps, data_version)
+        lap_table = await shield(loader.pending_lap_table)
+    if lap_table.data_version != data_version:
+        lap_table.ingest(laps, data_version)
+    return lap_table
 
 
 def _resolve_lap_data(
-    session: Session, current_driver_laps: Laps, queries: list[SessionQuery]
-) -> LapSelectionData:
-    filtered_laps = _filter_session(current_driver_laps, queries)
-    formatted_laps = filtered_laps[
-        [
-            "Driver",
-            "Team",
-            "LapTime",
-            "Sector1Time",
-            "Sector2Time",
-            "Sector3Time",
-            "SpeedI1",
-            "SpeedI2",
-            "SpeedFL",
-            "Stint",
-            "TyreLife",
-            "Position",
-            "Compound",
-            "PitInTime",
-            "PitOutTime",
-            "LapNumber"
-        ]
-    ]
-    _rename_sector_columns(formatted_laps)
-    populated_laps = _populate_with_data(formatted_laps)
-
-    _fix_floating_point_precision(populated_laps)
-    _set_is_personal_best_sector(populated_laps)
-    _set_is_personal_best(populated_laps)
-    _set_purple_sectors(populated_laps)
-    _set_purple_speedtraps(populated_laps)
-
-    populated_laps.set_index(["Driver", "Team"], inplace=True)
+    loader: SessionLoader,
+    lap_table: LapTable,
+    queries: list[SessionQuery],
+    since_version: int | None = None,
+) -> dict:
+    """Resolves the laps matching the queries, serialized in the shape of `LapSelectionData`"""
+    selections = lap_table.select(queries)
     lap_data = []
-    for index in populated_laps.index.unique():
-        current_driver_laps = populated_laps.loc[[index]]
-        flying_laps = current_driver_laps[current_driver_laps["IsFlyingLap"]]
-        stint_groups = flying_laps.groupby("Stint")
-        filtered_stint_groups = stint_groups.agg(
-            avg_time=NamedAgg(column="LapTime", aggfunc="mean"),
-            min_time=NamedAgg(column="LapTime", aggfunc="min"),
-            max_time=NamedAgg(column="LapTime", aggfunc="max"),
-            low_quartile=NamedAgg(column="LapTime", aggfunc=lambda x: x.quantile(0.25)),
-            high_quartile=NamedAgg(
-                column="LapTime", aggfunc=lambda x: x.quantile(0.75)
-            ),
-            median=NamedAgg(column="LapTime", aggfunc=lambda x: x.median()),
-            total_laps=NamedAgg(column="LapTime", aggfunc="count"),
-        )
-
-        style = get_driver_style(driver=index[0], session=session)
+    for selection in selections:
+        style = loader.get_driver_style(selection.driver)
         lap_data.append(
-            DriverLapData(
-                driver=index[0],
-                team=index[1],
-                color=style['Color'],
-                alternative_style=style['IsDashed'],
-                stints=filtered_stint_groups.to_dict(orient="records"),
-                session_data=StintData(
-                    total_laps=len(current_driver_laps),
-                    avg_time=(flying_laps["LapTime"].mean()),
-                    min_time=(current_driver_laps["LapTime"].min()),
-                    max_time=(current_driver_laps["LapTime"].max()),
-                    low_quartile=(current_driver_laps["LapTime"].quantile(0.25)),
-                    high_quartile=(current_driver_laps["LapTime"].quantile(0.75)),
-                    median=(flying_laps["LapTime"].median()),
-                ),
-                laps=(current_driver_laps.to_dict(orient="records")),
+            (
+                selection.statistics.min_time,
+                {
+                    "driver": selection.driver,
+                    "team": selection.team,
+                    "color": style["Color"],
+                    "alternative_style": style["IsDashed"],
+                    "session_data": selection.statistics.session_data,
+                    "stints": selection.statistics.stints,
+                    "laps": lap_table.records(selection.positions, since_version),
+                },
             )
         )
 
-    lap_data.sort(key=lambda x: x.session_data.min_time)
-    flying_laps = populated_laps[populated_laps["IsFlyingLap"]]
-    return LapSelectionData(
-        driver_lap_data=lap_data,
-        low_decile=flying_laps["LapTime"].quantile(0.1),  # type: ignore
-        high_decile=flying_laps["LapTime"].quantile(0.9),  # type: ignore
-        min_time=populated_laps["LapTime"].min(),
-        max_time=populated_laps["LapTime"].max(),
-    )
+    lap_data.sort(key=lambda x: x[0])
+    return {
+        "driver_lap_data": [driver_lap_data for _, driver_lap_data in lap_data],
+        **lap_table.summarize(selections),
+        "data_version": lap_table.data_version,
+    }
 
 
 async def get_resolved_laptime_data(
@@ -179,6 +85,7 @@ async def get_resolved_laptime_data(
     session_identifier: SessionIdentifier | int,
     queries: list[SessionQuery],
     is_testing: bool = False,
-) -> LapSelectionData:
+    since_version: int | None = None,
+) -> dict:
     loader = get_loader(year=year, round=round_number, session_identifier=session_identifier, is_testing=is_testing)
-    return _resolve_lap_data(loader._session, await loader.laps, queries)
+    return _resolve_lap_data(loader, await get_lap_table(loader), queries, since_version)
@@ -0,0 +1,100 @@
+from typing import Any, Callable, Iterable, Mapping
+
+from numpy import array, float64, int64, isnan, isnat
+from pandas import DataFrame, Series, factorize, to_timedelta
+
+from utils.encoding import to_nullable_list
+
+
+def timedelta_to_seconds(values: Iterable) -> list[float | None]:
+    """Converts timedeltas to seconds exactly like `Timedelta.total_seconds`,
+    i.e. with microsecond precision, missing values are converted to None"""
+    timedeltas = to_timedelta(values).to_numpy().astype("timedelta64[ns]")
+    microseconds = timedeltas.view(int64) // 1000
+    seconds = (microseconds // 1_000_000).astype(float64) + (
+        microseconds % 1_000_000
+    ) / 1_000_000
+    return to_nullable_list(seconds, isnat(timedeltas))
+
+
+def _floats(column: Series) -> list[float | None]:
+    values = column.to_numpy(dtype=float64)
+    return to_nullable_list(values, isnan(values))
+
+
+def _integers(column: Series) -> list[int | None]:
+    values = column.to_numpy(dtype=float64)
+    missing = isnan(values)
+    values[missing] = 0
+    return to_nullable_list(values.astype(int64), missing)
+
+
+def _booleans(column: Series) -> list[bool]:
+    return column.to_numpy(dtype=bool).tolist()
+
+
+def _compounds(column: Series) -> list[str | None]:
+    codes, compounds = factorize(column)
+    # missing compounds have the code -1, which picks the trailing None
+    return array([*compounds, None], dtype=object)[codes].tolist()
+
+
+# column converters in the field order of `LapTimingData`
+LAP_TIMING_FIELDS: dict[str, Callable[[Series], list]] = {
+    "LapTime": timedelta_to_seconds,
+    "IsPB": _booleans,
+    "Sector1Time": timedelta_to_seconds,
+    "Sector2Time": timedelta_to_seconds,
+    "Sector3Time": timedelta_to_seconds,
+    "ST1": _floats,
+    "ST2": _floats,
+    "ST3": _floats,
+    "Stint": _integers,
+    "TyreLife": _integers,
+    "Compound": _compounds,
+    "IsOutlap": _booleans,
+    "IsInlap": _booleans,
+    "IsBestS1": _booleans,
+    "IsBestS2": _booleans,
+    "IsBestS3": _booleans,
+    "IsBestST1": _booleans,
+    "IsBestST2": _booleans,
+    "IsBestST3": _booleans,
+    "IsPBS1": _booleans,
+    "IsPBS2": _booleans,
+    "IsPBS3": _booleans,
+    "LapNumber": _integers,
+}
+
+# column converters in the field order of `StintData`
+STINT_FIELDS: dict[str, Callable[[Series], list]] = {
+    "total_laps": _integers,
+    "avg_time": timedelta_to_seconds,
+    "min_time": timedelta_to_seconds,
+    "max_time": timedelta_to_seconds,
+    "median": timedelta_to_seconds,
+    "low_quartile": timedelta_to_seconds,
+    "high_quartile": timedelta_to_seconds,
+}
+
+# column converters in the field order of `StintPaceData`
+STINT_PACE_FIELDS: dict[str, Callable[[Series], list]] = {
+    "stint": _integers,
+    "compound": _compounds,
+    "total_laps": _integers,
+    "first_lap": _integers,
+    "last_lap": _integers,
+    "avg_time": _floats,
+    "fuel_corrected_time": _floats,
+    "degradation": _floats,
+    "intercept": _floats,
+    "r_squared": _floats,
+}
+
+
+def serialize_records(
+    frame: DataFrame, fields: Mapping[str, Callable[[Series], list]]
+) -> list[dict[str, Any]]:
+    """Serializes the rows of the frame a column at a time"""
+    columns = [convert(frame[field]) for field, convert in fields.items()]
+    return [dict(zip(fields, row)) for row in zip(*columns)]
@@ -0,0 +1,465 @@
+from typing import Any, NamedTuple, Sequence
+
+from fastf1.core import Laps
+from numpy import (
+    add,
+    append,
+    arange,
+    array,
+    concatenate,
+    flatnonzero,
+    full,
+    iinfo,
+    int64,
+    intp,
+    isin,
+    isnat,
+    lexsort,
+    logical_and,
+    ndarray,
+    percentile,
+    stack,
+    timedelta64,
+    where,
+    zeros,
+)
+from pandas import NaT, DataFrame, MultiIndex, Series, Timedelta, concat, factorize, isna
+
+from core.models.queries import SessionQuery
+from services.laps.serialization import (
+    LAP_TIMING_FIELDS,
+    STINT_FIELDS,
+    serialize_records,
+    timedelta_to_seconds,
+)
+
+
+def _populate_with_data(laps: DataFrame):
+    return laps.assign(
+        IsOutlap=isna(laps["Sector1Time"]),
+        IsInlap=isna(laps["Sector3Time"]),
+        IsFlyingLap=(laps["PitInTime"].isna() & laps["PitOutTime"].isna()),
+    )
+
+
+def _rename_sector_columns(laps: DataFrame):
+    laps.rename(
+        columns={"SpeedI1": "ST1", "SpeedI2": "ST2", "SpeedFL": "ST3"}, inplace=True
+    )
+    return laps
+
+
+def _fix_floating_point_precision(laps: DataFrame):
+    laps[["LapTime", "Sector1Time", "Sector2Time", "Sector3Time"]].round(3)
+
+
+TIMES = ["LapTime", "Sector1Time", "Sector2Time", "Sector3Time"]
+SPEEDTRAPS = ["ST1", "ST2", "ST3"]
+BEST_FLAGS = [
+    "IsPB",
+    *(f"{flag}{sector}" for sector in (1, 2, 3) for flag in ("IsPBS", "IsBestS", "IsBestST")),
+]
+
+
+class SessionBests(NamedTuple):
+    # this personal best returns actual personal best laptime across
+    # the whole session, unlike the built in `IsPersonalBest` attribute
+    # that returns "rolling" personal best, i.e. the personal best at that point in time
+    # which means that there are multiple personal bests in the same session
+    personal_bests: DataFrame
+    purple_times: Series
+    purple_speedtraps: Series
+
+
+def _session_bests(laps: DataFrame) -> SessionBests:
+    return SessionBests(
+        personal_bests=laps.groupby("Driver")[TIMES].min(),
+        purple_times=laps[TIMES].min(),
+        purple_speedtraps=laps[SPEEDTRAPS].max(),
+    )
+
+
+def _merge_session_bests(bests: SessionBests, other: SessionBests) -> SessionBests:
+    return SessionBests(
+        personal_bests=concat([bests.personal_bests, other.personal_bests])
+        .groupby(level=0)
+        .min(),
+        purple_times=concat([bests.purple_times, other.purple_times], axis=1).min(axis=1),
+        purple_speedtraps=concat(
+            [bests.purple_speedtraps, other.purple_speedtraps], axis=1
+        ).max(axis=1),
+    )
+
+
+def _differs(values: DataFrame | Series, other: DataFrame | Series) -> ndarray:
+    """Elementwise inequality where missing values are equal to each other"""
+    return ((values != other) & ~(isna(values) & isna(other))).to_numpy()
+
+
+def _best_flags(laps: DataFrame, bests: SessionBests) -> DataFrame:
+    """Flags personal bests, purple sectors and purple speedtraps of the laps"""
+    personal_bests = bests.personal_bests.reindex(laps["Driver"])
+    flags = {"IsPB": laps["LapTime"] == personal_bests["LapTime"].to_numpy()}
+    for sector in (1, 2, 3):
+        column = f"Sector{sector}Time"
+        flags[f"IsPBS{sector}"] = laps[column] == personal_bests[column].to_numpy()
+        flags[f"IsBestS{sector}"] = laps[column] == bests.purple_times[column]
+        flags[f"IsBestST{sector}"] = (
+            laps[f"ST{sector}"] == bests.purple_speedtraps[f"ST{sector}"]
+        )
+    return DataFrame(flags, index=laps.index)
+
+
+def _format_session_laps(laps: Laps) -> DataFrame:
+    formatted_laps = laps[
+        [
+            "Driver",
+            "DriverNumber",
+            "Team",
+            "LapTime",
+            "Sector1Time",
+            "Sector2Time",
+            "Sector3Time",
+            "SpeedI1",
+            "SpeedI2",
+            "SpeedFL",
+            "Stint",
+            "TyreLife",
+            "Position",
+            "Compound",
+            "PitInTime",
+            "PitOutTime",
+            "LapNumber",
+            "TrackStatus",
+        ]
+    ]
+    _rename_sector_columns(formatted_laps)
+    populated_laps = _populate_with_data(formatted_laps)
+
+    _fix_floating_point_precision(populated_laps)
+    return populated_laps
+
+
+def quantiles(timedeltas: ndarray, levels: Sequence[float]) -> ndarray:
+    """Linearly interpolated quantiles of timedeltas without missing values,
+    computed the way `Series.quantile` computes them"""
+    if not len(timedeltas):
+        return full(len(levels), timedelta64("NaT", "ns"))
+
+    return percentile(
+        timedeltas.view(int64), array(levels) * 100.0, method="linear"
+    ).astype("timedelta64[ns]")
+
+
+class DriverStatistics(NamedTuple):
+    min_time: Timedelta
+    session_data: dict[str, Any]
+    stints: list[dict[str, Any]]
+
+
+def _laptime_statistics(
+    laps: DataFrame, keys: list[str]
+) -> tuple[list[tuple], DataFrame]:
+    """Statistics of the lap times of every group, computed in a single pass over the
+    int64 nanosecond lap times sorted by group. Returns the group keys in sorted order
+    along with a row of statistics for each of them"""
+    codes, levels = zip(*(factorize(laps[key], sort=True) for key in keys))
+    # missing lap times are sorted after the lap times of their group
+    laptimes = laps["LapTime"].to_numpy()
+    nanoseconds = where(isnat(laptimes), iinfo(int64).max, laptimes.view(int64))
+
+    grouped = logical_and.reduce([code >= 0 for code in codes])
+    order = lexsort((nanoseconds, *reversed(codes)))
+    order = order[grouped[order]]
+    sorted_codes = stack([code[order] for code in codes])
+    sorted_nanoseconds = nanoseconds[order]
+
+    if len(order):
+        starts = flatnonzero(
+            concatenate(
+                [[True], (sorted_codes[:, 1:] != sorted_codes[:, :-1]).any(axis=0)]
+            )
+        )
+        timed = sorted_nanoseconds != iinfo(int64).max
+        counts = add.reduceat(timed.astype(int64), starts)
+        sums = add.reduceat(where(timed, sorted_nanoseconds, 0), starts)
+    else:
+        starts = counts = sums = zeros(0, dtype=int64)
+    ends = append(starts[1:], len(order))
+
+    # same casts and interpolation as the reductions of `Series`
+    statistics = full((len(starts), 6), NaT.value, dtype=int64)
+    for group, (start, count, total) in enumerate(zip(starts, counts, sums)):
+        if not count:
+            continue
+        values = sorted_nanoseconds[start : start + count]
+        statistics[group, 0] = total / count
+        statistics[group, 1] = values[0]
+        statistics[group, 2] = values[-1]
+        statistics[group, 3:] = percentile(values, [50.0, 25.0, 75.0], method="linear")
+
+    timedeltas = statistics.view("timedelta64[ns]")
+    group_keys = [
+        tuple(level[code] for level, code in zip(levels, sorted_codes[:, start]))
+        for start in starts
+    ]
+    return group_keys, DataFrame(
+        {
+            "laps": ends - starts,
+            "total_laps": counts,
+            "avg_time": timedeltas[:, 0],
+            "min_time": timedeltas[:, 1],
+            "max_time": timedeltas[:, 2],
+            "median": timedeltas[:, 3],
+            "low_quartile": timedeltas[:, 4],
+            "high_quartile": timedeltas[:, 5],
+        }
+    )
+
+
+def driver_statistics(laps: DataFrame) -> dict[tuple[str, str], DriverStatistics]:
+    """Serialized session and stint statistics of every driver of the laps"""
+    flying_laps = laps[laps["IsFlyingLap"]]
+    stint_keys, stints = _laptime_statistics(flying_laps, ["Driver", "Team", "Stint"])
+    driver_keys, sessions = _laptime_statistics(laps, ["Driver", "Team"])
+    flying_keys, flying = _laptime_statistics(flying_laps, ["Driver", "Team"])
+
+    # the averages of a session only account for flying laps,
+    # the remaining statistics account for every lap
+    flying_positions = {key: position for position, key in enumerate(flying_keys)}
+    for column in ("avg_time", "median"):
+        values = flying[column].to_numpy()
+        sessions[column] = array(
+            [
+                values[flying_positions[key]]
+                if key in flying_positions
+                else timedelta64("NaT", "ns")
+                for key in driver_keys
+            ],
+            dtype="timedelta64[ns]",
+        )
+    sessions["total_laps"] = sessions["laps"]
+
+    stint_records: dict[tuple, list[dict[str, Any]]] = {}
+    for (driver, team, _), record in zip(
+        stint_keys, serialize_records(stints, STINT_FIELDS)
+    ):
+        stint_records.setdefault((driver, team), []).append(record)
+
+    return {
+        key: DriverStatistics(
+            min_time=Timedelta(min_time),
+            session_data=session_data,
+            stints=stint_records.get(key, []),
+        )
+        for key, min_time, session_data in zip(
+            driver_keys,
+            sessions["min_time"],
+            serialize_records(sessions, STINT_FIELDS),
+        )
+    }
+
+
+class DriverSelection(NamedTuple):
+    driver: str
+    team: str
+    positions: ndarray
+    statistics: DriverStatistics
+
+
+class LapTable:
+    """Laps of a session flagged for the lap resolver, along with the serialized laps and
+    the statistics of every driver.
+
+    The table is built once per loaded session, queries only pick rows from it.
+    Statistics are only computed again for queries that filter the laps of a driver.
+    Laps of live sessions are appended as they are completed, see `ingest`"""
+
+    def __init__(self, laps: Laps, data_version: int = 0) -> None:
+        self.laps = _format_session_laps(laps)
+        self._bests = _session_bests(self.laps)
+        self.laps = self.laps.assign(**_best_flags(self.laps, self._bests)).reset_index(
+            drop=True
+        )
+        self._records = serialize_records(self.laps, LAP_TIMING_FIELDS)
+        self._statistics = driver_statistics(self.laps)
+        # data version of the session the row was last added or changed at
+        self._revisions = full(len(self.laps), data_version, dtype=int64)
+        self.data_version = data_version
+        self._index()
+
+    def _index(self) -> None:
+        self._positions = self.laps.groupby(["Driver", "Team"], sort=False).indices
+        self._lap_numbers = self.laps["LapNumber"].to_numpy()
+        self._flying = self.laps["IsFlyingLap"].to_numpy()
+        self._laptimes = self.laps["LapTime"].to_numpy()
+        self._compounds = self.laps["Compound"].to_numpy()
+        self._stints = self.laps["Stint"].to_numpy()
+        self._tyre_life = self.laps["TyreLife"].to_numpy()
+        # track statuses are strings of the status codes the track went through during a lap
+        self._track_status_codes, self._track_statuses = factorize(self.laps["TrackStatus"])
+
+        # drivers can be queried either by abbreviation or by number
+        self._driver_keys: dict[str, list[tuple[str, str]]] = {}
+        identifiers = self.laps[["Driver", "DriverNumber", "Team"]].drop_duplicates()
+        for driver, number, team in identifiers.itertuples(index=False):
+            if (driver, team) not in self._positions:
+                continue
+            for identifier in (driver, number):
+                keys = self._driver_keys.setdefault(str(identifier), [])
+                if (driver, team) not in keys:
+                    keys.append((driver, team))
+
+        self.nbytes = int(self.laps.memory_usage(index=True).sum())
+
+    def ingest(self, laps: Laps, data_version: int) -> None:
+        """Appends the laps that are not part of the table yet, i.e. the laps a live session
+        completed since the table was built or last ingested.
+
+        Flags of the laps in the table are only evaluated again for the drivers that improved
+        their personal bests, or for every lap once a purple sector or speedtrap is improved.
+        Statistics are only computed again for the drivers that completed new laps"""
+        self.data_version = data_version
+        known = MultiIndex.from_frame(self.laps[["Driver", "LapNumber"]])
+        keys = MultiIndex.from_frame(laps[["Driver", "LapNumber"]])
+        new_laps = _format_session_laps(laps[~keys.isin(known) & laps["LapNumber"].notna()])
+        if new_laps.empty:
+            return
+
+        bests = _merge_session_bests(self._bests, _session_bests(new_laps))
+        previous_bests = self._bests.personal_bests.reindex(bests.personal_bests.index)
+        improved_drivers = bests.personal_bests.index[
+            _differs(bests.personal_bests, previous_bests).any(axis=1)
+        ]
+        purples_improved = _differs(bests.purple_times, self._bests.purple_times).any() or (
+            _differs(bests.purple_speedtraps, self._bests.purple_speedtraps).any()
+        )
+        self._bests = bests
+
+        # rows of the laps already in the table whose flags may have changed
+        rows = (
+            arange(len(self.laps))
+            if purples_improved
+            else flatnonzero(self.laps["Driver"].isin(improved_drivers))
+        )
+        flags = _best_flags(self.laps.iloc[rows], bests)
+        changed = _differs(flags, self.laps[BEST_FLAGS].iloc[rows]).any(axis=1)
+        rows = rows[changed]
+        columns = [self.laps.columns.get_loc(column) for column in BEST_FLAGS]
+        self.laps.iloc[rows, columns] = flags[changed].to_numpy()
+
+        offset = len(self.laps)
+        new_laps = new_laps.assign(**_best_flags(new_laps, bests))
+        self.laps = concat([self.laps, new_laps], ignore_index=True)
+
+        self._revisions = append(self._revisions, full(len(new_laps), data_version))
+        self._revisions[rows] = data_version
+        for position, record in zip(
+            rows, serialize_records(self.laps.iloc[rows], LAP_TIMING_FIELDS)
+        ):
+            self._records[position] = record
+        self._records.extend(
+            serialize_records(self.laps.iloc[offset:], LAP_TIMING_FIELDS)
+        )
+
+        self._statistics.update(
+            driver_statistics(
+                self.laps[self.laps["Driver"].isin(new_laps["Driver"].unique())]
+            )
+        )
+        self._index()
+
+    def _filter(self, query: SessionQuery, positions: ndarray) -> ndarray | None:
+        """Mask of the laps at the positions that match the filters of the query,
+        None if the query does not filter the laps"""
+        masks = []
+        if query.lap_filter:
+            masks.append(isin(self._lap_numbers[positions], query.lap_filter))
+        if query.compounds:
+            compounds = [compound.upper() for compound in query.compounds]
+            masks.append(isin(self._compounds[positions], compounds))
+        if query.stints:
+            masks.append(isin(self._stints[positions], query.stints))
+        if query.min_tyre_life is not None:
+            masks.append(self._tyre_life[positions] >= query.min_tyre_life)
+        if query.max_tyre_life is not None:
+            masks.append(self._tyre_life[positions] <= query.max_tyre_life)
+        if query.flying_laps_only:
+            masks.append(self._flying[positions])
+        if query.within_percent_of_best is not None:
+            laptimes = self._laptimes[positions]
+            timed = ~isnat(laptimes)
+            limit = (
+                laptimes[timed].min().view(int64) * (1 + query.within_percent_of_best / 100)
+                if timed.any()
+                else 0
+            )
+            masks.append(timed & (laptimes.view(int64) <= limit))
+        if query.track_statuses:
+            allowed = set(query.track_statuses)
+            # laps without a track status have the code -1, which picks the trailing False
+            matching = array(
+                [set(statuses) <= allowed for statuses in self._track_statuses] + [False]
+            )
+            masks.append(matching[self._track_status_codes[positions]])
+
+        return logical_and.reduce(masks) if masks else None
+
+    def select(self, queries: Sequence[SessionQuery]) -> list[DriverSelection]:
+        """Picks the laps of the queried drivers that match the filters of the queries.
+        Queries of the same driver are merged, a lap is picked if any of them matches it"""
+        masks: dict[tuple[str, str], ndarray | None] = {}
+        for query in queries:
+            driver = query.driver if query.driver.isdigit() else query.driver.upper()
+            for key in self._driver_keys.get(driver, []):
+                if key in masks and masks[key] is None:
+                    continue
+                mask = self._filter(query, self._positions[key])
+                masks[key] = mask if mask is None or key not in masks else masks[key] | mask
+
+        selections = []
+        for (driver, team), mask in masks.items():
+            positions = self._positions[(driver, team)]
+            if mask is None:
+                statistics = self._statistics[(driver, team)]
+            else:
+                positions = positions[mask]
+                if not len(positions):
+                    continue
+                statistics = driver_statistics(self.laps.iloc[positions])[(driver, team)]
+
+            selections.append(DriverSelection(driver, team, positions, statistics))
+
+        return selections
+
+    def records(
+        self, positions: ndarray, since_version: int | None = None
+    ) -> list[dict[str, Any]]:
+        """Serialized laps at the positions. With `since_version`, only the laps that were
+        added or whose flags changed after that data version are returned"""
+        if since_version is not None:
+            positions = positions[self._revisions[positions] > since_version]
+        return [self._records[position] for position in positions]
+
+    def summarize(self, selections: Sequence[DriverSelection]) -> dict[str, float | None]:
+        """Serialized lap time bounds of the selected laps"""
+        positions = concatenate(
+            [selection.positions for selection in selections] or [[]]
+        ).astype(intp)
+        laptimes = self._laptimes[positions]
+        timed = ~isnat(laptimes)
+        low_decile, high_decile = quantiles(
+            laptimes[timed & self._flying[positions]], [0.1, 0.9]
+        )
+        min_time, max_time = (
+            (laptimes[timed].min(), laptimes[timed].max()) if timed.any() else (NaT, NaT)
+        )
+        low_decile, high_decile, min_time, max_time = timedelta_to_seconds(
+            [low_decile, high_decile, min_time, max_time]
+        )
+        return {
+            "low_decile": low_decile,
+            "high_decile": high_decile,
+            "min_time": min_time,
+            "max_time": max_time,
+        }
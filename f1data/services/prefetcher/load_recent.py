@@ -1,32 +1,110 @@
-from datetime import datetime
-from anyio import create_task_group 
-import fastf1
-from services.session.session import SessionLoader
+from asyncio import Semaphore, to_thread
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple
+
+from anyio import create_task_group
+from fastapi import logger
+from pandas import Timestamp, isna
+
+from core.config import PREFETCH_DELAY_MINUTES, PREFETCH_MAX_CONCURRENCY, PREFETCH_WEEKENDS
+from core.models.queries import SessionIdentifier
+from services.event_schedule.event import get_schedule
+from services.laps.resolver import get_lap_table
+from services.session.registry import RegistryKey, session_registry
+
+# sessions with lower priorities are prefetched first
+SESSION_PRIORITIES: dict[SessionIdentifier, int] = {
+    SessionIdentifier.RACE: 0,
+    SessionIdentifier.SPRINT: 1,
+    SessionIdentifier.QUALIFYING: 2,
+    SessionIdentifier.SPRINT_QUALIFYING: 3,
+    SessionIdentifier.SHOOTOUT: 3,
+    SessionIdentifier.FP1: 4,
+    SessionIdentifier.FP2: 4,
+    SessionIdentifier.FP3: 4,
+}
+_TESTING_PRIORITY = 4
+
+PUBLICATION_DELAY = timedelta(minutes=PREFETCH_DELAY_MINUTES)
+
+
+class ScheduledSession(NamedTuple):
+    key: RegistryKey
+    # position of the event of the session in the schedule
+    weekend: int
+    starts_at: Timestamp
+    priority: int
+
+    @property
+    def published_at(self) -> Timestamp:
+        """Time the data of the session is expected to be available at"""
+        return self.starts_at + PUBLICATION_DELAY
+
+
+def scheduled_sessions(schedule: list[dict[str, Any]], year: int) -> list[ScheduledSession]:
+    """Sessions of the season schedule under the registry keys the routes use"""
+    sessions = []
+    test_number = 0
+    for weekend, event in enumerate(schedule):
+        is_testing = event["EventFormat"] == "testing"
+        test_number += is_testing
+        for number in range(1, 6):
+            name = event.get(f"Session{number}")
+            starts_at = event.get(f"Session{number}DateUtc")
+            if isna(starts_at) or not (is_testing or name in SESSION_PRIORITIES):
+                continue
+
+            if is_testing:
+                key = RegistryKey(str(year), test_number, number, True)
+                priority = _TESTING_PRIORITY
+            else:
+                identifier = SessionIdentifier(name)
+                key = RegistryKey(str(year), int(event["RoundNumber"]), identifier, False)
+                priority = SESSION_PRIORITIES[identifier]
+            sessions.append(ScheduledSession(key, weekend, Timestamp(starts_at), priority))
+
+    return sessions
+
+
+def recent_sessions(sessions: list[ScheduledSession], now: datetime) -> list[ScheduledSession]:
+    """Published sessions of the most recent weekends, in the order they are prefetched in:
+    races before qualifying before practice, the most recent ones first"""
+    published = [session for session in sessions if session.published_at <= now]
+    weekends = sorted({session.weekend for session in published})[-PREFETCH_WEEKENDS:]
+    return sorted(
+        (session for session in published if session.weekend in weekends),
+        key=lambda session: (session.priority, -session.starts_at.value),
+    )
+
+
+def utc_now() -> datetime:
+    # the schedule holds naive UTC timestamps
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def _prefetch_session(session: ScheduledSession, semaphore: Semaphore) -> None:
+    async with semaphore:
+        loader = session_registry.get(session.key)
+        try:
+            # the laps are what most of the requests of a session are served from
+            await get_lap_table(loader)
+        except Exception:
+            logger.logger.warning(
+                "Failed to prefetch %s %s %s",
+                loader.year,
+                loader.round,
+                loader.session_identifier,
+                exc_info=True,
+            )
 
 
 async def prefetch_recent_events():
-    now = datetime.now()
-    schedule = fastf1.get_event_schedule(year=now.year)
-    past_weekends = schedule[schedule["Session1DateUtc"] < now].tail(2)
+    """Loads the laps of the sessions of the most recent weekends into the session registry,
+    at most `PREFETCH_MAX_CONCURRENCY` sessions at a time"""
+    now = utc_now()
+    schedule = await to_thread(get_schedule, now.year)
+    semaphore = Semaphore(PREFETCH_MAX_CONCURRENCY)
     async with create_task_group() as tg:
-        for weekend in past_weekends.iterrows():
-            for session_index, key in enumerate(
-                [
-                    "Session1DateUtc",
-                    "Session2DateUtc",
-                    "Session3DateUtc",
-                    "Session4DateUtc",
-                    "Session5DateUtc",
-                ]
-            ):
-                if weekend[1][key] < now:
-                    round_number = weekend[1]["RoundNumber"]
-                    if weekend[1][key]:
-                        is_testing = weekend[1]["EventFormat"] == "testing"
-                        loader = SessionLoader(
-                            year=str(now.year),
-                            round=round_number + 1 if is_testing else round_number,
-                            session_identifier=session_index + 1,
-                            is_testing=is_testing,
-                        )
-                        tg.start_soon(loader.fetch_all_data)
+        # the semaphore is acquired in the order the sessions are started in
+        for session in recent_sessions(scheduled_sessions(schedule, now.year), now):
+            tg.start_soon(_prefetch_session, session, semaphore)
@@ -0,0 +1,63 @@
+from asyncio import CancelledError, Task, create_task, sleep, to_thread
+from datetime import datetime, timedelta
+
+from fastapi import logger
+
+from core.config import PREFETCH_MAX_INTERVAL_HOURS
+from services.event_schedule.event import get_schedule
+from services.prefetcher.load_recent import prefetch_recent_events, scheduled_sessions, utc_now
+
+# wait before prefetching again after a failure, e.g. when the schedule is unavailable
+_RETRY_INTERVAL = timedelta(minutes=15)
+
+
+class PrefetchScheduler:
+    """Prefetches the recent sessions in the background. The prefetch runs again once the
+    data of the next session of the schedule is expected to be published, and at least
+    every `max_interval`"""
+
+    def __init__(self, max_interval: timedelta) -> None:
+        self._max_interval = max_interval
+        self._task: Task | None = None
+
+    async def next_run(self, now: datetime) -> datetime:
+        schedule = await to_thread(get_schedule, now.year)
+        upcoming = [
+            session.published_at
+            for session in scheduled_sessions(schedule, now.year)
+            if session.published_at > now
+        ]
+        return min([*upcoming, now + self._max_interval])
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await prefetch_recent_events()
+                now = utc_now()
+                delay = await self.next_run(now) - now
+            except Exception:
+                logger.logger.exception("Failed to prefetch the recent events")
+                delay = _RETRY_INTERVAL
+
+            logger.logger.info("Next prefetch in %s", delay)
+            await sleep(delay.total_seconds())
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except CancelledError:
+            pass
+        self._task = None
+
+
+prefetch_scheduler = PrefetchScheduler(
+    max_interval=timedelta(hours=PREFETCH_MAX_INTERVAL_HOURS)
+)
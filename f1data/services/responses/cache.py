@@ -0,0 +1,333 @@
+import json
+import os
+import shutil
+from collections import OrderedDict
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from typing import Any, Awaitable, Callable, Mapping, NamedTuple, Sequence
+
+from fastapi import Request, Response, logger
+
+from core.config import COMPRESSION_MIN_BYTES, RESPONSE_CACHE_BYTES, RESPONSE_CACHE_DIR
+from core.models.queries import SessionQuery
+from services.responses.models import ResponseCacheMetrics
+from services.session.registry import RegistryKey, session_registry
+from utils.compression import (
+    GZIP,
+    IDENTITY,
+    compress,
+    decompress,
+    negotiate_content_encoding,
+)
+
+# bumped whenever the rendered responses change, so that responses cached on disk by an
+# older release are never served
+RESPONSE_SCHEMA_VERSION = 1
+
+
+class ResponseKey(NamedTuple):
+    session: RegistryKey
+    # version of the session data the response was rendered from, only meaningful within
+    # the process as it starts from 0 in every worker
+    data_version: int
+    # digest of the canonical request
+    digest: str
+    schema_version: int = RESPONSE_SCHEMA_VERSION
+
+
+def _session_digest(session: RegistryKey) -> str:
+    return sha256(json.dumps([str(part) for part in session]).encode()).hexdigest()[:16]
+
+
+class ResponseCache:
+    """Byte budgeted LRU of rendered response bodies, stored compressed.
+
+    Bodies are stored gzip compressed, or as they are when they are too small to be worth
+    compressing. Other content encodings are added to the entry of a response once they
+    are requested, so that repeated hits never compress again.
+
+    With a directory, the responses of sessions that are not live are written to disk too,
+    responses evicted from memory or cached before a restart are read back from there.
+    Responses on disk are keyed by the schema version instead of the data version, they are
+    dropped through `invalidate` whenever the data of a session changes.
+    Responses rendered from an older version of the data of a session are dropped once
+    a response of a newer version is cached, which only happens for live sessions"""
+
+    def __init__(self, max_bytes: int, directory: str | None) -> None:
+        self._entries: OrderedDict[ResponseKey, dict[str, bytes]] = OrderedDict()
+        self._versions: dict[RegistryKey, int] = {}
+        self._max_bytes = max_bytes
+        self._directory = Path(directory) if directory else None
+        self._lock = Lock()
+
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _session_directory(self, session: RegistryKey) -> Path | None:
+        if self._directory is None:
+            return None
+        return self._directory / f"v{RESPONSE_SCHEMA_VERSION}" / _session_digest(session)
+
+    def _path(self, key: ResponseKey, encoding: str) -> Path | None:
+        directory = self._session_directory(key.session)
+        if directory is None:
+            return None
+        return directory / f"{key.digest}.{encoding}"
+
+    def _remove(self, key: ResponseKey) -> None:
+        self.nbytes -= sum(len(body) for body in self._entries.pop(key).values())
+
+    def _evict(self) -> None:
+        # the ordered dict is kept in the order of access, least recently used first
+        while self.nbytes > self._max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _store(self, key: ResponseKey, encoding: str, body: bytes) -> dict[str, bytes]:
+        with self._lock:
+            if key.data_version > self._versions.get(key.session, 0):
+                for stale in [stale for stale in self._entries if stale.session == key.session]:
+                    self._remove(stale)
+            self._versions[key.session] = max(
+                key.data_version, self._versions.get(key.session, 0)
+            )
+
+            entry = self._entries.setdefault(key, {})
+            self._entries.move_to_end(key)
+            self.nbytes += len(body) - len(entry.get(encoding, b""))
+            entry[encoding] = body
+            self._evict()
+            return entry
+
+    def get(self, key: ResponseKey, persistent: bool) -> dict[str, bytes] | None:
+        """Bodies of the cached response by their content encoding. Responses of sessions
+        that are not persistent are only looked up in memory"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        for encoding in (GZIP, IDENTITY) if persistent else ():
+            path = self._path(key, encoding)
+            if path is not None and path.is_file():
+                entry = self._store(key, encoding, path.read_bytes())
+                break
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key: ResponseKey, body: bytes, persistent: bool) -> dict[str, bytes]:
+        encoding = IDENTITY if len(body) < COMPRESSION_MIN_BYTES else GZIP
+        stored = compress(body, encoding)
+        entry = self._store(key, encoding, stored)
+
+        path = self._path(key, encoding)
+        if persistent and path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # written under a temporary name first so that readers never see partial files
+                temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                temporary.write_bytes(stored)
+                os.replace(temporary, path)
+            except OSError:
+                logger.logger.exception("Failed to write the cached response %s", path)
+        return entry
+
+    def encode(self, key: ResponseKey, entry: dict[str, bytes], encoding: str) -> tuple[str, bytes]:
+        """Body of the cached response in the content encoding, or as it is stored when it
+        is too small to be compressed. Encodings missing from the entry are cached"""
+        if IDENTITY in entry:
+            return IDENTITY, entry[IDENTITY]
+        if encoding in entry:
+            return encoding, entry[encoding]
+
+        body = decompress(entry[GZIP], GZIP)
+        if encoding == IDENTITY:
+            return IDENTITY, body
+        encoded = compress(body, encoding)
+        self._store(key, encoding, encoded)
+        return encoding, encoded
+
+    def invalidate(self, session: RegistryKey) -> None:
+        """Drops every cached response of the session, from memory and from disk"""
+        with self._lock:
+            for key in [key for key in self._entries if key.session == session]:
+                self._remove(key)
+        directory = self._session_directory(session)
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def metrics(self) -> ResponseCacheMetrics:
+        with self._lock:
+            return ResponseCacheMetrics(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                responses=len(self._entries),
+                memory_usage=self.nbytes,
+                max_memory_usage=self._max_bytes,
+            )
+
+
+response_cache = ResponseCache(
+    max_bytes=RESPONSE_CACHE_BYTES, directory=RESPONSE_CACHE_DIR
+)
+
+
+def canonical_queries(queries: Sequence[SessionQuery]) -> list[dict[str, Any]]:
+    """Queries normalized and sorted, so that requests that only differ in the order of
+    their queries or lap numbers share their cached response"""
+    canonical = []
+    for query in queries:
+        data = query.model_dump(mode="json")
+        data["driver"] = query.driver if query.driver.isdigit() else query.driver.upper()
+        if data["compounds"]:
+            data["compounds"] = [compound.upper() for compound in data["compounds"]]
+        # empty filters do not filter the laps just like missing ones
+        for field in ("lap_filter", "compounds", "stints", "track_statuses"):
+            data[field] = sorted(set(data[field])) if data[field] else None
+        canonical.append(data)
+
+    return sorted(canonical, key=lambda data: json.dumps(data, sort_keys=True))
+
+
+def _request_digest(request: Request, media_type: str, body: Any) -> str:
+    return sha256(
+        json.dumps(
+            [
+                request.url.path,
+                sorted(request.query_params.multi_items()),
+                media_type,
+                body,
+            ],
+            sort_keys=True,
+            default=str,
+        ).encode()
+    ).hexdigest()
+
+
+def entity_tag(*parts: Any) -> str:
+    """Strong entity tag of a response that is fully determined by the parts and the
+    response schema version"""
+    digest = sha256(
+        json.dumps([RESPONSE_SCHEMA_VERSION, *parts], sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _representation_tag(etag: str, encoding: str) -> str:
+    # strong tags have to tell the content encodings of a response apart
+    return etag if encoding == IDENTITY else f'{etag[:-1]}-{encoding}"'
+
+
+def _vary_on_encoding(headers: Mapping[str, str]) -> dict[str, str]:
+    headers = dict(headers)
+    vary = [headers.pop(name) for name in list(headers) if name.lower() == "vary"]
+    if "accept-encoding" not in ", ".join(vary).lower():
+        vary.append("Accept-Encoding")
+    headers["Vary"] = ", ".join(vary)
+    return headers
+
+
+def not_modified(
+    request: Request, etag: str, headers: Mapping[str, str], encoding: str = IDENTITY
+) -> Response | None:
+    """Responds with 304 when the client holds the response with the entity tag already,
+    in any content encoding. If-None-Match compares tags weakly, the 304 carries the tag
+    of the representation in the content encoding that would be sent"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+
+    for tag in (tag.strip() for tag in if_none_match.split(",")):
+        tag = tag.removeprefix("W/")
+        if tag == "*" or tag.strip('"').split("-")[0] == etag.strip('"'):
+            headers = {
+                name: value
+                for name, value in headers.items()
+                if name.lower() != "content-length"
+            }
+            headers["ETag"] = _representation_tag(etag, encoding)
+            return Response(status_code=304, headers=_vary_on_encoding(headers))
+    return None
+
+
+def _selected_encoding(request: Request, entry: dict[str, bytes] | None) -> str:
+    # bodies too small to be compressed are sent as they are whatever the client accepts
+    if entry is not None and IDENTITY in entry:
+        return IDENTITY
+    return negotiate_content_encoding(request.headers.get("accept-encoding"))
+
+
+def _encoded_response(
+    key: ResponseKey,
+    entry: dict[str, bytes],
+    request: Request,
+    etag: str,
+    media_type: str | None,
+    headers: Mapping[str, str],
+) -> Response:
+    encoding, body = response_cache.encode(key, entry, _selected_encoding(request, entry))
+    headers = {
+        name: value for name, value in headers.items() if name.lower() != "content-length"
+    }
+    headers["ETag"] = _representation_tag(etag, encoding)
+    if encoding != IDENTITY:
+        # uncompressed bodies pass through the compression middleware, which adds Vary itself
+        headers = _vary_on_encoding(headers)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+async def cached_response(
+    request: Request,
+    session: RegistryKey,
+    media_type: str,
+    headers: Mapping[str, str],
+    resolve: Callable[[], Awaitable[Any]],
+    render: Callable[[Any], Response],
+    body: Any = None,
+) -> Response:
+    """Serves the response to the request from the response cache. Responses missing from
+    the cache are resolved, rendered and cached.
+
+    `body` is the canonical form of the request body, the path and the query parameters
+    of the request are part of the cache key as well. The entity tag of the response is
+    derived from the cache key, so revalidations are answered without rendering the response.
+    Bodies are sent in the content encoding negotiated through `Accept-Encoding`"""
+    loader = session_registry.find(session)
+    is_live = loader is not None and loader.is_live
+    if is_live:
+        # cached responses skip the resolvers, which refresh live sessions otherwise
+        await loader.refresh()
+
+    key = ResponseKey(
+        session,
+        loader.data_version if loader is not None else 0,
+        _request_digest(request, media_type, body),
+    )
+    etag = entity_tag(*key)
+    entry = response_cache.get(key, persistent=not is_live)
+    unmodified = not_modified(request, etag, headers, _selected_encoding(request, entry))
+    if unmodified is not None:
+        return unmodified
+
+    if entry is not None:
+        return _encoded_response(key, entry, request, etag, media_type, headers)
+
+    response = render(await resolve())
+    if response.status_code != 200:
+        return response
+
+    entry = response_cache.put(key, response.body, persistent=not is_live)
+    # the rendered response carries the content type along with the route's headers
+    return _encoded_response(key, entry, request, etag, None, response.headers)
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+
+
+class ResponseCacheMetrics(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    responses: int
+    memory_usage: int
+    max_memory_usage: int
@@ -0,0 +1,58 @@
+from asyncio import Future, Lock, ensure_future, gather, get_running_loop, shield
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable, Sequence, TypeVar
+from weakref import WeakValueDictionary
+
+from core.config import LOADER_MAX_WORKERS
+
+T = TypeVar("T")
+
+
+class LoaderExecutor:
+    """Runs blocking fastf1 loads on a bounded thread pool to keep the event loop responsive.
+
+    Jobs of the same session are executed one at a time as `Session.load` mutates the session,
+    jobs submitted under the key of a job that is already in flight await its result instead
+    of running again"""
+
+    def __init__(self, max_workers: int) -> None:
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="session-loader"
+        )
+        self._session_locks: WeakValueDictionary[Hashable, Lock] = (
+            WeakValueDictionary()
+        )
+        self._in_flight: dict[tuple[Hashable, Hashable], Future] = {}
+
+    async def _run_exclusive(self, session_key: Hashable, job: Callable[[], T]) -> T:
+        lock = self._session_locks.get(session_key)
+        if lock is None:
+            lock = Lock()
+            self._session_locks[session_key] = lock
+
+        async with lock:
+            return await get_running_loop().run_in_executor(self._pool, job)
+
+    async def run(self, session_key: Hashable, job_key: Hashable, job: Callable[[], T]) -> T:
+        """Runs the job of the session, `job_key` identifies the work the job does as the
+        jobs themselves are usually new partials that never compare equal"""
+        flight_key = (session_key, job_key)
+        future = self._in_flight.get(flight_key)
+        if future is None:
+            future = ensure_future(self._run_exclusive(session_key, job))
+            self._in_flight[flight_key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(flight_key, None))
+
+        # a cancelled request must not cancel the load other requests are waiting for
+        return await shield(future)
+
+    async def map(self, jobs: Sequence[Callable[[], T]]) -> list[T]:
+        """Runs independent jobs on the pool in parallel, results are returned in order"""
+        loop = get_running_loop()
+        return list(await gather(*(loop.run_in_executor(self._pool, job) for job in jobs)))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+loader_executor = LoaderExecutor(max_workers=LOADER_MAX_WORKERS)
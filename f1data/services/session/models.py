@@ -0,0 +1,25 @@
+from pydantic import BaseModel
+
+from core.models.queries import SessionIdentifier
+
+
+class RegistryMetrics(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    sessions: int
+    pinned: int
+    memory_usage: int
+    # memory of the telemetry mapped from snapshots, shared with the other worker processes
+    mapped_memory_usage: int
+    max_memory_usage: int
+    snapshots_enabled: bool
+
+
+class LiveSession(BaseModel):
+    year: str
+    round: int
+    session_identifier: SessionIdentifier | int
+    is_testing: bool = False
+    # livetiming files of the session, relative to the livetiming directory
+    files: list[str] = []
@@ -1,16 +1,122 @@
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
 from threading import Lock
 
+from fastapi import logger
+from pandas import isna
+
+from core.config import REGISTRY_MAX_BYTES, REGISTRY_PIN_RECENT_DAYS, SNAPSHOT_DIR
 from core.models.queries import SessionIdentifier
+from services.session.models import RegistryMetrics
 from services.session.session import SessionLoader
+from services.session.snapshot import snapshots_enabled
 
 RegistryKey = namedtuple(
     "registry_key", ["year", "round", "session_identifier", "is_testing"]
 )
 
-session_registry: dict[RegistryKey, SessionLoader] = {}
 
-lock = Lock()
+class SessionRegistry:
+    """Keeps session loaders around for reuse. Once the loaded data exceeds the memory budget,
+    the least recently used sessions are evicted, unless they are pinned or took place recently"""
+
+    def __init__(self, max_bytes: int, pin_recent_days: int) -> None:
+        self._loaders: OrderedDict[RegistryKey, SessionLoader] = OrderedDict()
+        self._pinned: set[RegistryKey] = set()
+        self._max_bytes = max_bytes
+        self._recent_period = timedelta(days=pin_recent_days)
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: RegistryKey) -> SessionLoader:
+        with self._lock:
+            loader = self._loaders.get(key)
+            if loader is not None:
+                self.hits += 1
+                self._loaders.move_to_end(key)
+            else:
+                self.misses += 1
+                loader = SessionLoader(*key)
+                self._loaders[key] = loader
+
+            self._evict(keep=key)
+            return loader
+
+    def find(self, key: RegistryKey) -> SessionLoader | None:
+        """Returns the loader of a registered session without counting it as an access"""
+        with self._lock:
+            return self._loaders.get(key)
+
+    def pin(self, key: RegistryKey) -> None:
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key: RegistryKey) -> None:
+        with self._lock:
+            self._pinned.discard(key)
+
+    def _is_pinned(self, key: RegistryKey, loader: SessionLoader) -> bool:
+        if key in self._pinned:
+            return True
+
+        session_date = loader.session_date
+        if isna(session_date):
+            return False
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return now - session_date < self._recent_period
+
+    def _evict(self, keep: RegistryKey) -> None:
+        memory_usage = sum(loader.memory_usage for loader in self._loaders.values())
+
+        # the ordered dict is kept in the order of access, least recently used first
+        for key in list(self._loaders):
+            if memory_usage <= self._max_bytes:
+                return
+
+            loader = self._loaders[key]
+            if key == keep or self._is_pinned(key, loader):
+                continue
+
+            memory_usage -= loader.memory_usage
+            del self._loaders[key]
+            self.evictions += 1
+            logger.logger.warning(
+                "Evicted session %s %s %s, %d bytes in use",
+                key.year,
+                key.round,
+                key.session_identifier,
+                memory_usage,
+            )
+
+    def metrics(self) -> RegistryMetrics:
+        with self._lock:
+            return RegistryMetrics(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                sessions=len(self._loaders),
+                pinned=sum(
+                    self._is_pinned(key, loader)
+                    for key, loader in self._loaders.items()
+                ),
+                memory_usage=sum(
+                    loader.memory_usage for loader in self._loaders.values()
+                ),
+                mapped_memory_usage=sum(
+                    loader.mapped_memory_usage for loader in self._loaders.values()
+                ),
+                max_memory_usage=self._max_bytes,
+                snapshots_enabled=snapshots_enabled(SNAPSHOT_DIR),
+            )
+
+
+session_registry = SessionRegistry(
+    max_bytes=REGISTRY_MAX_BYTES, pin_recent_days=REGISTRY_PIN_RECENT_DAYS
+)
 
 
 def get_loader(
@@ -19,11 +125,18 @@ def get_loader(
     session_identifier: SessionIdentifier | int,
     is_testing: bool = False,
 ) -> SessionLoader:
-    with lock:
-        key = RegistryKey(year, round, session_identifier, is_testing)
-        if session_registry.get(key) is not None:
-            return session_registry[key]
-
-        loader = SessionLoader(year, round, session_identifier, is_testing)
-        session_registry[key] = loader
-        return loader
+    return session_registry.get(
+        RegistryKey(year, round, session_identifier, is_testing)
+    )
+
+
+def is_live_session(
+    year: str,
+    round: int,
+    session_identifier: SessionIdentifier | int,
+    is_testing: bool = False,
+) -> bool:
+    loader = session_registry.find(
+        RegistryKey(year, round, session_identifier, is_testing)
+    )
+    return loader is not None and loader.is_live
@@ -1,15 +1,83 @@
-from asyncio import Lock
-from anyio import sleep
+from asyncio import Future, ensure_future, shield
+from contextlib import nullcontext
+from enum import StrEnum
+from functools import partial
+from time import monotonic
+from typing import Any, ContextManager, Iterable, Sequence
 from fastapi import logger
 import fastf1
-from fastf1.core import Laps, SessionResults
-from pandas import DataFrame
+from fastf1.core import Laps, SessionResults, Telemetry
+from fastf1.livetiming.data import LiveTimingData
+from fastf1.mvapi import CircuitInfo
+from pandas import DataFrame, Timestamp
 from fastf1.core import DataNotLoadedError
 
+from core.config import LAP_TELEMETRY_CACHE_BYTES, LIVE_REFRESH_SECONDS, SNAPSHOT_DIR
 from core.models.queries import SessionIdentifier
+from services.session.executor import loader_executor
+from services.session.snapshot import session_snapshot
+from services.laps.table import LapTable
+from services.telemetry.cache import LapTelemetryCache
+from services.telemetry.normalization import normalize_telemetry
+from utils.get_driver_color import DriverStyle, get_driver_style, get_driver_styles
+
+
+class DataTier(StrEnum):
+    ESSENTIALS = "essentials"
+    LAPS = "laps"
+    TELEMETRY = "telemetry"
+    WEATHER = "weather"
+
+
+# the tier that has to be loaded before the given one can be
+TIER_DEPENDENCIES: dict[DataTier, DataTier | None] = {
+    DataTier.ESSENTIALS: None,
+    DataTier.LAPS: DataTier.ESSENTIALS,
+    DataTier.TELEMETRY: DataTier.LAPS,
+    DataTier.WEATHER: DataTier.ESSENTIALS,
+}
+
+# attributes of the fastf1 session that make up every tier in the snapshot of a session,
+# frames are stored column oriented and the remaining attributes are pickled
+SNAPSHOT_FRAMES: dict[DataTier, tuple[str, ...]] = {
+    DataTier.ESSENTIALS: ("_results",),
+    DataTier.LAPS: ("_laps", "_track_status", "_session_status"),
+    DataTier.TELEMETRY: (),
+    DataTier.WEATHER: ("_weather_data",),
+}
+SNAPSHOT_ATTRIBUTES: dict[DataTier, tuple[str, ...]] = {
+    DataTier.ESSENTIALS: ("_session_info",),
+    DataTier.LAPS: ("_total_laps", "_session_start_time", "_session_split_times"),
+    DataTier.TELEMETRY: ("_t0_date",),
+    DataTier.WEATHER: (),
+}
+# tiers whose loads change the frames of a tier besides the tier itself, the results are
+# completed from the laps and loading the telemetry adds the start dates of the laps
+SNAPSHOT_SOURCES: dict[DataTier, tuple[DataTier, ...]] = {
+    DataTier.ESSENTIALS: (DataTier.LAPS,),
+    DataTier.LAPS: (DataTier.TELEMETRY,),
+    DataTier.TELEMETRY: (),
+    DataTier.WEATHER: (),
+}
+# telemetry is stored as a frame per driver
+SNAPSHOT_TELEMETRY = ("_car_data", "_pos_data")
+# circuit info is stored next to the tiers once it has been resolved
+_CIRCUIT_INFO = "circuit_info"
+
 
 class SessionLoader:
-    """The loader is used to minimize the amount of data loaded"""
+    """The loader is used to minimize the amount of data loaded.
+
+    Data is loaded in tiers. Concurrent requests for a tier await the same shared future and
+    missing lower tiers are loaded by the same `Session.load` call as the requested one.
+
+    Processed data is written to a snapshot of the session once it is loaded, later loads
+    restore the tiers from the snapshot instead of running fastf1 again. Telemetry is
+    normalized to compact dtypes before it is written.
+
+    Live sessions are loaded from recorded livetiming files instead of the API, their laps
+    are reloaded on `refresh` and every reload bumps the data version. Their data is never
+    written to or restored from snapshots"""
 
     def __init__(
         self,
@@ -30,20 +98,35 @@ class SessionLoader:
             )
         )
 
-        self._has_essentials_loaded = False
-        self._has_loaded_laps = False
-        self._has_loaded_telemetry = False
-        self._has_loaded_messages = False
-        self._has_loaded_weather = False
+        self._loaded_tiers: set[DataTier] = set()
+        self._pending_tiers: dict[DataTier, Future] = {}
+        self._circuit_info: CircuitInfo | None = None
+        self._driver_styles: dict[str, DriverStyle] = {}
+        self._snapshot = session_snapshot(
+            SNAPSHOT_DIR, year, round, session_identifier, is_testing
+        )
 
         self.year = year
-        self.round = round 
+        self.round = round
         self.session_identifier = session_identifier
 
-        self.essentials_lock = Lock()
-        self.laps_lock = Lock()
-        self.telemetry_lock = Lock()
-        self.weather_lock = Lock()
+        self.lap_telemetry_cache = LapTelemetryCache(LAP_TELEMETRY_CACHE_BYTES)
+        # laps of the session prepared for the lap resolver, built on first use
+        self.lap_table: LapTable | None = None
+        # build of the lap table in flight, awaited by the requests arriving meanwhile
+        self.pending_lap_table: Future | None = None
+        self._data_memory_usage = 0
+        # memory of the frames mapped from the snapshot, which is shared with other processes,
+        # recorded per tier when the tier is restored
+        self._mapped_tiers: dict[DataTier, int] = {}
+
+        self._live_files: list[str] | None = None
+        self._refreshed_at: float | None = None
+        # incremented when live mode is stopped, loads started before are discarded
+        self._generation = 0
+        # incremented every time the laps of a live session are reloaded
+        # and when the session is switched to live mode
+        self.data_version = 0
 
     @staticmethod
     def get_is_testing(year: str, round: int):
@@ -53,125 +136,372 @@ class SessionLoader:
             return True
         return False
 
-    def _fetch_laps(self) -> Laps:
-        self._session.load(
-            laps=True, telemetry=False, weather=False, messages=False
-        )
-        if self._session.laps is not None:
-            self._has_loaded_laps = True
-            return self._session.laps
-        raise DataNotLoadedError
+    @property
+    def session_date(self) -> Timestamp:
+        return self._session.date
 
     @property
-    async def laps(self) -> Laps:
-        async with self.laps_lock:
-            if self._has_loaded_laps:
-                return self._session.laps
+    def total_laps(self) -> int | None:
+        """Scheduled amount of laps of race-like sessions, None when it is unknown"""
+        try:
+            return self._session.total_laps
+        except DataNotLoadedError:
+            return None
 
-            return self._fetch_laps()
+    @property
+    def is_live(self) -> bool:
+        return self._live_files is not None
 
-    def _fetch_results(self) -> SessionResults:
-        self._session.load(
-            laps=False, telemetry=False, weather=False, messages=False
-        )
-        if self._session.results is not None:
-            return self._session.results
-        raise DataNotLoadedError
+    def enable_live(self, files: Sequence[str]) -> None:
+        """Loads the session from the livetiming files from now on, the files are
+        expected to be appended to by the livetiming recorder"""
+        self._live_files = list(files)
+        self._refreshed_at = None
+        self.data_version += 1
+
+    def disable_live(self) -> None:
+        """Drops everything loaded from the livetiming files, the session is loaded from the
+        API or its snapshot again on the next request"""
+        self._live_files = None
+        self._refreshed_at = None
+        self._generation += 1
+        self._loaded_tiers.clear()
+        self._pending_tiers.clear()
+        self._mapped_tiers.clear()
+        self._circuit_info = None
+        self.lap_table = None
+        self.pending_lap_table = None
+        self.lap_telemetry_cache = LapTelemetryCache(LAP_TELEMETRY_CACHE_BYTES)
+        self.data_version += 1
+
+    def is_loaded(self, tier: DataTier) -> bool:
+        return tier in self._loaded_tiers
 
     @property
-    async def results(self) -> SessionResults:
-        async with self.essentials_lock:
-            if self._has_essentials_loaded and self._session.results is not None:
-                return self._session.results
+    def driver_styles(self) -> dict[str, DriverStyle]:
+        """Styles of the drivers taking part in the session, resolved once the session is loaded"""
+        return self._driver_styles
+
+    def get_driver_style(self, driver: str) -> DriverStyle:
+        style = self._driver_styles.get(driver)
+        if style is None:
+            style = get_driver_style(driver, self._session)
+            self._driver_styles[driver] = style
+        return style
+
+    @property
+    def mapped_memory_usage(self) -> int:
+        return sum(self._mapped_tiers.values())
+
+    @property
+    def memory_usage(self) -> int:
+        """Approximate amount of memory held by the loaded data, in bytes. Frames mapped from
+        the snapshot of the session are not included"""
+        lap_table_usage = self.lap_table.nbytes if self.lap_table is not None else 0
+        return self._data_memory_usage + self.lap_telemetry_cache.nbytes + lap_table_usage
+
+    def _update_memory_usage(self) -> None:
+        frames: list[DataFrame] = []
+        for name in ("results", "laps", "weather_data"):
+            try:
+                frames.append(getattr(self._session, name))
+            except DataNotLoadedError:
+                pass
+
+        for name in ("car_data", "pos_data"):
+            try:
+                frames.extend(getattr(self._session, name).values())
+            except DataNotLoadedError:
+                pass
+
+        frames = [frame for frame in frames if frame is not None]
+        self._data_memory_usage = (
+            int(sum(frame.memory_usage(index=True).sum() for frame in frames))
+            - self.mapped_memory_usage
+        )
+
+    def _is_available(self, tier: DataTier) -> bool:
+        try:
+            if tier == DataTier.ESSENTIALS:
+                return (
+                    bool(self._session.session_info)
+                    and self._session.results is not None
+                )
+            if tier == DataTier.LAPS:
+                return self._session.laps is not None
+            if tier == DataTier.TELEMETRY:
+                return bool(self._session.car_data)
+            return self._session.weather_data is not None
+        except DataNotLoadedError:
+            return False
+
+    def _snapshot_tier(self, tier: DataTier) -> tuple[dict[str, DataFrame], dict[str, Any]]:
+        frames = {
+            name: getattr(self._session, name)
+            for name in SNAPSHOT_FRAMES[tier]
+            if getattr(self._session, name, None) is not None
+        }
+        attributes = {
+            name: getattr(self._session, name)
+            for name in SNAPSHOT_ATTRIBUTES[tier]
+            if hasattr(self._session, name)
+        }
+        if tier == DataTier.TELEMETRY:
+            for name in SNAPSHOT_TELEMETRY:
+                for driver, telemetry in getattr(self._session, name, {}).items():
+                    frames[f"{name}.{driver}"] = telemetry
+
+        return frames, attributes
+
+    def _restore_tier(self, tier: DataTier) -> None:
+        # telemetry is the bulk of the data and is only ever sliced, so it is kept mapped
+        frames, attributes, mapped_nbytes = self._snapshot.read(
+            tier, writable=tier != DataTier.TELEMETRY
+        )
+        self._mapped_tiers[tier] = mapped_nbytes
+        for name, value in attributes.items():
+            setattr(self._session, name, value)
+
+        if tier == DataTier.TELEMETRY:
+            for name in SNAPSHOT_TELEMETRY:
+                setattr(self._session, name, {})
+        for name, frame in frames.items():
+            name, _, driver = name.partition(".")
+            if driver:
+                getattr(self._session, name)[driver] = Telemetry(
+                    frame, session=self._session, driver=driver
+                )
+            elif name == "_results":
+                self._session._results = SessionResults(frame)
+            elif name == "_laps":
+                self._session._laps = Laps(frame, session=self._session)
+            else:
+                setattr(self._session, name, frame)
+
+    def _normalize_telemetry(self) -> None:
+        before = after = 0
+        for name in SNAPSHOT_TELEMETRY:
+            telemetries = getattr(self._session, name)
+            for driver, telemetry in telemetries.items():
+                normalized = normalize_telemetry(telemetry)
+                before += telemetry.memory_usage(index=True, deep=True).sum()
+                after += normalized.memory_usage(index=True, deep=True).sum()
+                telemetries[driver] = normalized
+
+        logger.logger.warning(
+            "Normalized the telemetry of %s %s %s from %d to %d bytes",
+            self.year,
+            self.round,
+            self.session_identifier,
+            before,
+            after,
+        )
 
-            return self._fetch_results()
+    def _snapshot_holds(self, tier: DataTier, loaded: Iterable[DataTier]) -> bool:
+        """Whether the snapshot holds the tier as complete as a load of the tiers makes it"""
+        sources = {tier, *(source for source in SNAPSHOT_SOURCES[tier] if source in loaded)}
+        return sources <= self._snapshot.sources(tier)
 
-    def fetch_lap_telemetry(self) -> Laps:
-        if self._has_loaded_laps:
-            self._session.load(
-                laps=False, telemetry=True, weather=False, messages=False
+    def _restore_snapshot(self, tiers: tuple[DataTier, ...]) -> bool:
+        """Restores the tiers from the snapshot of the session, when it holds all of them"""
+        if self._snapshot is None or self._live_files:
+            return False
+        if not all(self._snapshot_holds(tier, tiers) for tier in tiers):
+            return False
+
+        try:
+            for tier in tiers:
+                self._restore_tier(tier)
+        except Exception:
+            # a broken snapshot is replaced by loading the session through fastf1
+            logger.logger.exception(
+                "Failed to restore %s %s %s", self.year, self.round, self.session_identifier
             )
-        else:
-            self._session.load(
-                laps=True, telemetry=True, weather=False, messages=False
+            self._snapshot.discard()
+            return False
+        return True
+
+    def _save_snapshot(self) -> None:
+        """Writes the tiers of the session the snapshot is missing, along with the tiers it
+        holds that the last load completed"""
+        if self._snapshot is None or self._live_files:
+            return
+
+        available = [tier for tier in DataTier if self._is_available(tier)]
+        for tier in available:
+            if self._snapshot_holds(tier, available):
+                continue
+
+            sources = [source for source in SNAPSHOT_SOURCES[tier] if source in available]
+            self._snapshot.write(tier, *self._snapshot_tier(tier), sources)
+            if tier == DataTier.TELEMETRY and self._snapshot.holds(tier):
+                # the loaded telemetry is swapped for the mapped files the other processes use
+                try:
+                    self._restore_tier(tier)
+                except Exception:
+                    logger.logger.exception("Failed to map the telemetry snapshot")
+
+    def _snapshot_lock(self) -> ContextManager[None]:
+        """Lock of the snapshot across processes. The snapshot and its manifest are only
+        written under it, so that the processes do not drop each other's tiers"""
+        if self._snapshot is None or self._live_files:
+            return nullcontext()
+        return self._snapshot.lock()
+
+    def _load(self, tiers: tuple[DataTier, ...]) -> list[DataTier]:
+        # the process holding the lock loads the session, the others wait for its snapshot
+        with self._snapshot_lock():
+            if not self._restore_snapshot(tiers):
+                for tier in tiers:
+                    self._mapped_tiers.pop(tier, None)
+                self._session.load(
+                    laps=DataTier.LAPS in tiers,
+                    telemetry=DataTier.TELEMETRY in tiers,
+                    weather=DataTier.WEATHER in tiers,
+                    messages=False,
+                    livedata=LiveTimingData(*self._live_files) if self._live_files else None,
+                )
+                if DataTier.TELEMETRY in tiers and self._is_available(DataTier.TELEMETRY):
+                    self._normalize_telemetry()
+                self._save_snapshot()
+
+        self._update_memory_usage()
+        loaded = [tier for tier in tiers if self._is_available(tier)]
+        if DataTier.ESSENTIALS in loaded and not self._driver_styles:
+            self._driver_styles = get_driver_styles(self._session)
+
+        return loaded
+
+    def _load_circuit_info(self) -> CircuitInfo | None:
+        with self._snapshot_lock():
+            if self._snapshot is not None and self._snapshot.holds(_CIRCUIT_INFO):
+                try:
+                    frames, attributes, _ = self._snapshot.read(_CIRCUIT_INFO)
+                    return CircuitInfo(**frames, **attributes)
+                except Exception:
+                    logger.logger.exception("Failed to restore the circuit info")
+
+            circuit_info = self._session.get_circuit_info()
+            if circuit_info and self._snapshot is not None and not self._live_files:
+                self._snapshot.write(
+                    _CIRCUIT_INFO,
+                    {
+                        "corners": circuit_info.corners,
+                        "marshal_lights": circuit_info.marshal_lights,
+                        "marshal_sectors": circuit_info.marshal_sectors,
+                    },
+                    {"rotation": circuit_info.rotation},
+                )
+            return circuit_info
+
+    def _reload_laps(self) -> list[DataTier]:
+        return self._load((DataTier.ESSENTIALS, DataTier.LAPS))
+
+    async def refresh(self) -> None:
+        """Reloads the laps of a live session, at most once per refresh interval.
+        fastf1 parses the livetiming files from the start on every reload"""
+        if self._live_files is None or (
+            self._refreshed_at is not None
+            and monotonic() - self._refreshed_at < LIVE_REFRESH_SECONDS
+        ):
+            return
+
+        self._refreshed_at = monotonic()
+        generation = self._generation
+        loaded = await loader_executor.run(self, "refresh", self._reload_laps)
+        if generation == self._generation:
+            self._loaded_tiers.update(loaded)
+            self.data_version += 1
+
+    async def _load_tiers(
+        self, tiers: list[DataTier], dependencies: list[Future]
+    ) -> None:
+        for dependency in dependencies:
+            await dependency
+
+        if tiers:
+            generation = self._generation
+            loaded = await loader_executor.run(
+                self, ("load", tuple(tiers)), partial(self._load, tuple(tiers))
             )
-        if self._session.laps is not None:
-            self._has_loaded_telemetry = True
-            return self._session.laps
+            if generation == self._generation:
+                self._loaded_tiers.update(loaded)
 
-        raise DataNotLoadedError
+    def _schedule(self, tiers: Iterable[DataTier]) -> Future:
+        missing: list[DataTier] = []
+        dependencies: list[Future] = []
+        for tier in tiers:
+            current = tier
+            while (
+                current is not None
+                and current not in self._loaded_tiers
+                and current not in missing
+            ):
+                pending = self._pending_tiers.get(current)
+                if pending is not None:
+                    dependencies.append(pending)
+                    break
+                missing.append(current)
+                current = TIER_DEPENDENCIES[current]
 
-    @property
-    async def lap_telemetry(self) -> Laps:
-        async with self.telemetry_lock:
-            if self._has_loaded_telemetry:
-                return self._session.laps
+        future = ensure_future(self._load_tiers(missing, dependencies))
+        for tier in missing:
+            self._pending_tiers[tier] = future
 
-            return self.fetch_lap_telemetry()
+        def release(_):
+            for tier in missing:
+                if self._pending_tiers.get(tier) is future:
+                    del self._pending_tiers[tier]
 
-    def _fetch_session_info(self) -> dict:
-        self._session.load(
-            laps=False, telemetry=False, weather=False, messages=False
-        )
-        if self._session.session_info:
-            self._has_essentials_loaded = True
-            return self._session.session_info
-        else:
+        future.add_done_callback(release)
+        return future
+
+    async def _ensure(self, *tiers: DataTier) -> None:
+        if all(tier in self._loaded_tiers for tier in tiers):
+            return
+
+        await shield(self._schedule(tiers))
+        if not all(tier in self._loaded_tiers for tier in tiers):
             raise DataNotLoadedError
 
     @property
-    async def session_info(self) -> dict:
-        async with self.essentials_lock:
-            if self._has_essentials_loaded and self._session.session_info:
-                return self._session.session_info
-
-            return self._fetch_session_info()
-
-    def _fetch_weather_data(self) -> DataFrame:
-        self._session.load(
-            laps=False,
-            telemetry=False,
-            weather=True,
-            messages=False,
-        )
-        if self._session.weather_data is not None:
-            self._has_loaded_weather = True
-            return self._session.weather_data
-        else:
-            raise DataNotLoadedError
+    async def laps(self) -> Laps:
+        await self._ensure(DataTier.LAPS)
+        return self._session.laps
 
     @property
-    async def weather(self):
-        async with self.weather_lock: 
-            if self._has_loaded_weather and self._session.weather_data is not None:
-                return self._session.weather_data
+    async def results(self) -> SessionResults:
+        await self._ensure(DataTier.ESSENTIALS)
+        return self._session.results
 
-            return self._fetch_weather_data()
+    @property
+    async def lap_telemetry(self) -> Laps:
+        await self._ensure(DataTier.TELEMETRY)
+        return self._session.laps
 
     @property
-    async def circuit_info(self):
-        async with self.telemetry_lock: 
-            async with self.laps_lock:
-                if self._has_loaded_telemetry and self._has_loaded_laps:
-                    circuit_info = self._session.get_circuit_info()
-                    if circuit_info: 
-                        return circuit_info
-                    raise DataNotLoadedError
-
-                self.fetch_lap_telemetry()
-
-                circuit_info = self._session.get_circuit_info()
-                if circuit_info: 
-                    return circuit_info
-
-                raise DataNotLoadedError
-    
+    async def session_info(self) -> dict:
+        await self._ensure(DataTier.ESSENTIALS)
+        return self._session.session_info
+
+    @property
+    async def weather(self) -> DataFrame:
+        await self._ensure(DataTier.WEATHER)
+        return self._session.weather_data
+
+    @property
+    async def circuit_info(self) -> CircuitInfo:
+        if self._circuit_info is not None:
+            return self._circuit_info
+
+        await self._ensure(DataTier.TELEMETRY)
+        circuit_info = await loader_executor.run(self, "circuit_info", self._load_circuit_info)
+        if circuit_info:
+            self._circuit_info = circuit_info
+            return circuit_info
+
+        raise DataNotLoadedError
+
     async def fetch_all_data(self):
         logger.logger.warning('Loading data for %s %s %s', self.year, self.session_identifier, self.round)
-        async with self.laps_lock:
-            async with self.telemetry_lock:
-                async with self.weather_lock: 
-                    self._session.load(laps=True, telemetry=True, weather=True, messages=False)
-                    self._has_loaded_laps = True
-                    self._has_loaded_telemetry = True
-                    self._has_loaded_weather = True
\ No newline at end of file
+        await self._ensure(DataTier.TELEMETRY, DataTier.WEATHER)
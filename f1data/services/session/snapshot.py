@@ -0,0 +1,226 @@
+import json
+import os
+import pickle
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Mapping, NamedTuple
+
+import fastf1
+import pandas
+from fastapi import logger
+from numpy import ndarray
+from pandas import Categorical, DataFrame
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# bumped whenever the layout of the snapshots changes, older snapshots are discarded
+SNAPSHOT_SCHEMA_VERSION = 3
+
+_MANIFEST = "manifest.json"
+_ATTRIBUTES = "attributes.pkl"
+
+
+class InvalidSnapshotError(Exception):
+    pass
+
+
+def _versions() -> dict[str, Any]:
+    # pickled attributes hold pandas objects and frames are processed by fastf1
+    return {
+        "schema_version": SNAPSHOT_SCHEMA_VERSION,
+        "fastf1_version": fastf1.__version__,
+        "pandas_version": pandas.__version__,
+    }
+
+
+def _write_frame(path: Path, frame: DataFrame) -> list[str]:
+    table = pyarrow.Table.from_pandas(frame)
+    # uncompressed Arrow IPC files (Feather v2) can be memory mapped as they are
+    with pyarrow.OSFile(str(path), "wb") as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return table.schema.names
+
+
+def _mapped_nbytes(frame: DataFrame, mapping: "pyarrow.Buffer") -> int:
+    # columns that were copied when the table was converted live outside of the mapping
+    start, end = mapping.address, mapping.address + mapping.size
+    nbytes = 0
+    for column in frame.columns:
+        values = frame[column].values
+        if isinstance(values, Categorical):
+            values = values.codes
+        if isinstance(values, ndarray) and values.nbytes:
+            address = values.__array_interface__["data"][0]
+            if start <= address and address + values.nbytes <= end:
+                nbytes += values.nbytes
+    return nbytes
+
+
+def _read_frame(path: Path, columns: list[str], writable: bool) -> tuple[DataFrame, int]:
+    source = pyarrow.memory_map(str(path), "r")
+    table = pyarrow.ipc.open_file(source).read_all()
+    if table.schema.names != columns:
+        raise InvalidSnapshotError(f"Unexpected columns in {path}")
+    # without copies, numeric columns are read only views of the mapped file
+    frame = table.to_pandas(split_blocks=not writable, zero_copy_only=False)
+    if writable:
+        return frame, 0
+    source.seek(0)
+    return frame, _mapped_nbytes(frame, source.read_buffer())
+
+
+class SnapshotTier(NamedTuple):
+    frames: dict[str, DataFrame]
+    attributes: dict[str, Any]
+    # bytes of the frames that share the memory of the mapped files
+    mapped_nbytes: int
+
+
+class SessionSnapshot:
+    """Processed data of a session stored on local disk, so that the session can be restored
+    without fastf1 parsing and merging its raw data again.
+
+    The snapshot holds the frames and attributes of every data tier of the session that was
+    loaded. Frames are stored column oriented as uncompressed Arrow IPC (Feather) files and
+    memory mapped when they are read back, the remaining attributes are pickled like fastf1
+    caches its own data. A manifest lists the tiers along with the columns of their frames
+    and the tiers that were loaded along with each of them, as loading a tier completes the
+    frames of others. Snapshots written by another schema version or another version of
+    fastf1 are discarded.
+
+    Snapshots are shared by the worker processes, which map the same files and therefore
+    share the memory of the mapped frames. A session is loaded under the lock of its
+    snapshot, so that a single process loads it and the others restore what it wrote"""
+
+    def __init__(self, directory: Path) -> None:
+        self._directory = directory
+
+    def _read_manifest(self) -> dict[str, Any] | None:
+        try:
+            manifest = json.loads((self._directory / _MANIFEST).read_text())
+        except (OSError, ValueError):
+            return None
+
+        if any(manifest.get(key) != value for key, value in _versions().items()):
+            logger.logger.warning("Discarding the outdated snapshot %s", self._directory)
+            self.discard()
+            return None
+        return manifest
+
+    def _write_manifest(self, manifest: dict[str, Any]) -> None:
+        path = self._directory / _MANIFEST
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        temporary.write_text(json.dumps(manifest))
+        os.replace(temporary, path)
+
+    def holds(self, *tiers: str) -> bool:
+        manifest = self._read_manifest()
+        return manifest is not None and all(tier in manifest["tiers"] for tier in tiers)
+
+    def sources(self, tier: str) -> set[str]:
+        """Tiers that were loaded along with the tier when it was written, empty when the
+        snapshot does not hold the tier"""
+        manifest = self._read_manifest()
+        if manifest is None or tier not in manifest["tiers"]:
+            return set()
+        return {tier, *manifest["sources"].get(tier, ())}
+
+    def read(self, tier: str, writable: bool = True) -> SnapshotTier:
+        """Frames and attributes of the tier. Frames that are not writable share the memory
+        of the mapped files, their numeric columns must not be modified in place"""
+        manifest = self._read_manifest()
+        if manifest is None or tier not in manifest["tiers"]:
+            raise InvalidSnapshotError(f"Tier {tier} is missing from {self._directory}")
+
+        directory = self._directory / tier
+        frames = {}
+        mapped_nbytes = 0
+        for name, columns in manifest["tiers"][tier].items():
+            frames[name], nbytes = _read_frame(directory / f"{name}.arrow", columns, writable)
+            mapped_nbytes += nbytes
+        with open(directory / _ATTRIBUTES, "rb") as file:
+            attributes = pickle.load(file)
+        return SnapshotTier(frames, attributes, mapped_nbytes)
+
+    def write(
+        self,
+        tier: str,
+        frames: Mapping[str, DataFrame],
+        attributes: Mapping[str, Any],
+        sources: Iterable[str] = (),
+    ) -> None:
+        """Writes the tier to a temporary directory first and replaces the tier with it,
+        the manifest is only updated once all of its files are in place. `sources` are the
+        tiers loaded along with the tier, a tier is rewritten once more of them are loaded"""
+        directory = self._directory / tier
+        temporary = self._directory / f"{tier}.{os.getpid()}.tmp"
+        try:
+            shutil.rmtree(temporary, ignore_errors=True)
+            temporary.mkdir(parents=True)
+            columns = {
+                name: _write_frame(temporary / f"{name}.arrow", frame)
+                for name, frame in frames.items()
+            }
+            with open(temporary / _ATTRIBUTES, "wb") as file:
+                pickle.dump(dict(attributes), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+            manifest = self._read_manifest() or {**_versions(), "tiers": {}, "sources": {}}
+            manifest["tiers"].pop(tier, None)
+            self._write_manifest(manifest)
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(temporary, directory)
+            manifest["tiers"][tier] = columns
+            manifest["sources"][tier] = sorted(set(sources) - {tier})
+            self._write_manifest(manifest)
+        except (OSError, pyarrow.ArrowException, pickle.PicklingError):
+            logger.logger.exception("Failed to write the snapshot %s", directory)
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Exclusive lock of the snapshot across processes. The lock file is kept next to the
+        snapshot, so that discarding the snapshot does not release it"""
+        path = self._directory.with_name(f"{self._directory.name}.lock")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            file = open(path, "a")
+        except OSError:
+            logger.logger.exception("Failed to open the snapshot lock %s", path)
+            yield
+            return
+
+        with file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            # closing the file releases the lock
+            yield
+
+    def discard(self) -> None:
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+
+def snapshots_enabled(directory: str | None) -> bool:
+    """Whether sessions are snapshotted, which requires a directory and pyarrow"""
+    return directory is not None and pyarrow is not None
+
+
+def session_snapshot(
+    directory: str | None, year: str, round: int | str, session_identifier: Any, is_testing: bool
+) -> SessionSnapshot | None:
+    """Snapshot of the session inside of the directory, None when snapshots are disabled"""
+    if not snapshots_enabled(directory):
+        return None
+
+    event = f"testing-{round}" if is_testing else str(round)
+    return SessionSnapshot(Path(directory) / str(year) / event / str(session_identifier))
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Iterable, Sequence
+
+from fastf1.core import Laps, Telemetry
+from numpy import bool_, float32, float64, int8, ndarray
+
+from services.telemetry.normalization import with_continuous_floats
+
+# dtype each channel is stored with and the amount of decimals that dtype can represent
+# for the range of values of the channel. Values are rounded to it when they are read back
+CHANNELS: dict[str, tuple[type, int | None]] = {
+    "Speed": (float32, 4),
+    "Throttle": (float32, 4),
+    "Brake": (bool_, None),
+    "nGear": (int8, None),
+    "RPM": (float32, 2),
+    "Distance": (float32, 3),
+    "RelativeDistance": (float32, 6),
+    "Time": (float32, 4),
+    "X": (float32, 2),
+    "Y": (float32, 2),
+}
+
+
+class LapTelemetry:
+    """Telemetry channels of a single lap, stored as compact numpy arrays"""
+
+    def __init__(self, channels: dict[str, ndarray]) -> None:
+        self._channels = channels
+        self.nbytes = sum(values.nbytes for values in channels.values())
+
+    @classmethod
+    def from_telemetry(cls, telemetry: Telemetry) -> "LapTelemetry":
+        channels = {}
+        for channel, (dtype, _) in CHANNELS.items():
+            values = telemetry[channel]
+            if channel == "Time":
+                values = values.dt.total_seconds()
+            if dtype is not float32:
+                values = values.fillna(0)
+            channels[channel] = values.to_numpy().astype(dtype)
+
+        return cls(channels)
+
+    def __getitem__(self, channel: str) -> ndarray:
+        values = self._channels[channel]
+        decimals = CHANNELS[channel][1]
+        if decimals is None:
+            return values
+        return values.astype(float64).round(decimals)
+
+    def __len__(self) -> int:
+        return len(self._channels["Distance"])
+
+
+def _merge_lap_telemetry(
+    lap: Laps, car_data: Telemetry, pos_data: Telemetry
+) -> Telemetry:
+    # same as `Laps.get_telemetry` without the driver ahead channels, which are
+    # expensive to compute and not used by any of the endpoints
+    lap_pos_data = pos_data.slice_by_lap(lap, pad=1, pad_side="both")
+    lap_car_data = (
+        car_data.slice_by_lap(lap, pad=1, pad_side="both")
+        .add_distance()
+        .add_relative_distance()
+    )
+    return lap_pos_data.merge_channels(lap_car_data).slice_by_lap(
+        lap, interpolate_edges=True
+    )
+
+
+def slice_driver_laps(
+    laps: Laps, driver: str, lap_numbers: Sequence[int]
+) -> dict[int, LapTelemetry]:
+    """Builds the telemetry of several laps of a driver. The car and position data are
+    sliced to the span covering all of the laps once, every lap is then cut out of that span"""
+    driver_laps = laps.pick_drivers(driver).pick_laps(list(lap_numbers))
+    car_data = with_continuous_floats(driver_laps.get_car_data(pad=1, pad_side="both"))
+    pos_data = with_continuous_floats(driver_laps.get_pos_data(pad=1, pad_side="both"))
+    return {
+        int(lap_number): LapTelemetry.from_telemetry(
+            _merge_lap_telemetry(
+                driver_laps.pick_laps(int(lap_number)), car_data, pos_data
+            )
+        )
+        for lap_number in driver_laps["LapNumber"]
+    }
+
+
+class LapTelemetryCache:
+    """Least recently used cache of lap telemetry of a session, keyed by driver and lap number"""
+
+    def __init__(self, max_bytes: int) -> None:
+        self._entries: OrderedDict[tuple[str, int], LapTelemetry] = OrderedDict()
+        self._max_bytes = max_bytes
+        self._lock = Lock()
+        self.nbytes = 0
+
+    def lookup(
+        self, keys: Iterable[tuple[str, int]]
+    ) -> dict[tuple[str, int], LapTelemetry]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = entry
+
+        return found
+
+    def put(self, key: tuple[str, int], entry: LapTelemetry) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+
+            self._entries[key] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self._max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
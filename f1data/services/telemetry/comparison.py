@@ -0,0 +1,87 @@
+from math import ceil
+from typing import Sequence
+
+from numpy import (
+    arange,
+    array,
+    concatenate,
+    diff,
+    interp,
+    intp,
+    linspace,
+    minimum,
+    ndarray,
+)
+
+from core.config import COMPARISON_GRID_POINTS
+from services.telemetry.cache import LapTelemetry
+
+# channels of the compared laps that are resampled onto the grid
+COMPARED_CHANNELS = ("Time", "Speed")
+
+
+def lap_progress(distance: ndarray) -> ndarray:
+    """Share of the lap covered at every sample, from 0 at the start to 1 at the end of the lap"""
+    covered = distance - distance[0]
+    return covered / covered[-1]
+
+
+def grid_points(minisectors: int | None = None) -> int:
+    """Amount of points of the comparison grid, a multiple of the amount of minisectors plus one
+    so that every minisector spans the same amount of points"""
+    if not minisectors:
+        return COMPARISON_GRID_POINTS
+    return minisectors * ceil((COMPARISON_GRID_POINTS - 1) / minisectors) + 1
+
+
+class LapComparison:
+    """Channels of several laps resampled onto a shared grid of lap progress.
+
+    Every channel is a matrix with a row per lap and a column per point of the grid, so laps
+    are compared with each other by subtracting rows and any lap can be the reference one"""
+
+    def __init__(self, telemetries: Sequence[LapTelemetry], points: int) -> None:
+        self.grid = linspace(0, 1, points)
+        distances = [telemetry["Distance"] for telemetry in telemetries]
+        self.starts = array([distance[0] for distance in distances])
+        self.lengths = array([distance[-1] for distance in distances]) - self.starts
+
+        # lap i is laid out on [2i, 2i + 1] of a single axis, so that the samples every point
+        # of the grid lies between are found by one interpolation of the sample index instead
+        # of interpolating every channel of every lap separately
+        offsets = 2 * arange(len(telemetries))
+        axis = concatenate(
+            [lap_progress(distance) + offset for distance, offset in zip(distances, offsets)]
+        )
+        sample = interp(self.grid + offsets[:, None], axis, arange(len(axis)))
+        left = minimum(sample.astype(intp), len(axis) - 2)
+        weight = sample - left
+
+        self._channels = {}
+        for channel in COMPARED_CHANNELS:
+            values = concatenate([telemetry[channel] for telemetry in telemetries])
+            self._channels[channel] = values[left] + weight * (values[left + 1] - values[left])
+
+    def __getitem__(self, channel: str) -> ndarray:
+        return self._channels[channel]
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def distance(self, reference: int) -> ndarray:
+        """Distance of the reference lap at every point of the grid"""
+        return self.starts[reference] + self.grid * self.lengths[reference]
+
+    def gaps(self, reference: int) -> ndarray:
+        """Time every lap is behind the reference lap at every point of the grid"""
+        time = self["Time"]
+        return time - time[reference]
+
+    def fastest(self, minisectors: int | None = None) -> ndarray:
+        """Index of the fastest lap at every point of the grid. With minisectors, index of the
+        lap that covered each of the minisectors in the least time"""
+        if not minisectors:
+            return self["Speed"].argmax(axis=0)
+
+        step = (len(self.grid) - 1) // minisectors
+        return diff(self["Time"][:, ::step], axis=1).argmin(axis=0)
@@ -0,0 +1,120 @@
+from math import ceil
+from typing import Collection
+
+from numpy import (
+    arange,
+    clip,
+    concatenate,
+    empty,
+    full,
+    floor,
+    interp,
+    intp,
+    linspace,
+    nan,
+    nanargmax,
+    nanargmin,
+    ndarray,
+    searchsorted,
+    unique,
+)
+
+from core.models.queries import DownsamplingMode
+
+
+def lttb_indices(x: ndarray, y: ndarray, points: int) -> ndarray:
+    """Largest triangle three buckets: keeps the sample of every bucket that forms the largest
+    triangle with the previously kept sample and the average of the next bucket"""
+    n = len(x)
+    if points >= n or points < 3:
+        return arange(n)
+
+    # the first and the last samples are always kept, the rest is split into points - 2 buckets
+    edges = floor(linspace(1, n - 1, points - 1)).astype(intp)
+    indices = empty(points, dtype=intp)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket == points - 3:
+            next_x, next_y = x[-1], y[-1]
+        else:
+            next_end = edges[bucket + 2]
+            next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        areas = abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + areas.argmax()
+        indices[bucket + 1] = previous
+
+    return indices
+
+
+def minmax_indices(y: ndarray, points: int) -> ndarray:
+    """Keeps the minimum and the maximum sample of every bucket, so that peaks survive decimation"""
+    n = len(y)
+    if points >= n or points < 4:
+        return arange(n)
+
+    buckets = points // 2
+    bucket_size = ceil(n / buckets)
+    padded = full(buckets * bucket_size, nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, bucket_size)
+    # trailing buckets may consist of padding only
+    filled = (arange(buckets) * bucket_size) < n
+    offsets = arange(buckets)[filled] * bucket_size
+    return unique(
+        concatenate(
+            [
+                [0, n - 1],
+                offsets + nanargmin(padded[filled], axis=1),
+                offsets + nanargmax(padded[filled], axis=1),
+            ]
+        )
+    )
+
+
+def downsample(
+    channels: dict[str, ndarray],
+    points: int,
+    mode: DownsamplingMode,
+    x: str = "Distance",
+    y: str = "Speed",
+    discrete: Collection[str] = (),
+) -> dict[str, ndarray]:
+    """Reduces every channel to roughly the given amount of points.
+
+    `x` is the channel the samples are ordered by and `y` the channel whose shape is preserved
+    by the index based modes. Discrete channels are never interpolated, the previous sample is
+    used when the channels are resampled"""
+    distance = channels[x]
+    if len(distance) <= points:
+        return channels
+
+    if mode == DownsamplingMode.UNIFORM:
+        grid = linspace(distance[0], distance[-1], points)
+        previous = clip(
+            searchsorted(distance, grid, side="right") - 1, 0, len(distance) - 1
+        )
+        return {
+            channel: (
+                grid
+                if channel == x
+                else values[previous]
+                if channel in discrete
+                else interp(grid, distance, values)
+            )
+            for channel, values in channels.items()
+        }
+
+    indices = (
+        lttb_indices(distance, channels[y], points)
+        if mode == DownsamplingMode.LTTB
+        else minmax_indices(channels[y], points)
+    )
+    return {channel: values[indices] for channel, values in channels.items()}
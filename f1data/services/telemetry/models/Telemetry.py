@@ -1,23 +1,19 @@
 from typing import Sequence
 from xmlrpc.client import Boolean 
-from pandas import Timedelta, notna
-from pydantic import BaseModel, ConfigDict, field_serializer
+from pydantic import BaseModel, ConfigDict
 
 class TelemetryData(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
-    Throttle: Sequence[float]
-    Brake: Sequence[Boolean]
-    Gear: Sequence[int]
-    Speed: Sequence[float]
-    RPM: Sequence[float]
-    Time: Sequence[Timedelta]
-    RelativeDistance: Sequence[float]
-    Distance: Sequence[float]
-
-    @field_serializer('Time', mode='plain', when_used='json', return_type=Sequence[float])
-    def serialize_time(self, seq: Sequence[Timedelta]): 
-        return [val.total_seconds() if notna else None for val in seq] 
+    # channels that were not requested are left out of the response
+    Throttle: Sequence[float] | None = None
+    Brake: Sequence[Boolean] | None = None
+    Gear: Sequence[int] | None = None
+    Speed: Sequence[float] | None = None
+    RPM: Sequence[float] | None = None
+    Time: Sequence[float] | None = None
+    RelativeDistance: Sequence[float] | None = None
+    Distance: Sequence[float] | None = None
 
 
 class DriverTelemetryData(BaseModel):
@@ -34,12 +30,14 @@ class DeltaData(BaseModel):
 
     distance: Sequence[float]
     gap: Sequence[float]
+    speed: Sequence[float]
 
 
 class DriverTelemetryComparison(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     driver: str
+    lap: int
     color: str
     alternative_style: bool
     comparison: DeltaData
@@ -66,5 +64,6 @@ class TelemetryComparison(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     reference: str
+    reference_lap: int
     telemetries: list[DriverTelemetryComparison]
     circuit_data: CircuitData 
@@ -0,0 +1,72 @@
+from fastf1.core import Telemetry
+from numpy import float64, iinfo, int8, int16, int32, rint
+from pandas import CategoricalDtype, Series
+from pandas.api.types import is_bool_dtype, is_float_dtype, is_integer_dtype
+
+# channels none of the endpoints use, dropped from the telemetry of loaded sessions
+DROPPED_CHANNELS = ("Z",)
+
+# fastf1 fills in the source of the samples it interpolates, so it has to be a category already
+SOURCES = CategoricalDtype(["car", "pos", "interpolation"])
+
+# channels fastf1 interpolates when telemetry is merged, in the float dtype it expects
+CONTINUOUS_CHANNELS = tuple(
+    channel
+    for channel, spec in Telemetry._CHANNELS.items()
+    if spec["type"] == "continuous"
+)
+
+_INTEGER_DTYPES = (int8, int16, int32)
+
+
+def _compact_dtype(values: Series):
+    """Smallest integer dtype that represents every value exactly. Values that are not
+    all integral keep their dtype, a float32 copy would change the results of fastf1"""
+    if values.hasnans or not len(values):
+        return values.dtype
+
+    array = values.to_numpy()
+    if is_float_dtype(array.dtype) and not (array == rint(array)).all():
+        return values.dtype
+
+    low, high = array.min(), array.max()
+    for dtype in _INTEGER_DTYPES:
+        info = iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return values.dtype
+
+
+def normalize_telemetry(telemetry: Telemetry) -> Telemetry:
+    """Stores the channels of the telemetry of a driver in compact dtypes, the raw car and
+    position channels are integers. Unused channels are dropped"""
+    telemetry = telemetry.drop(
+        columns=[channel for channel in DROPPED_CHANNELS if channel in telemetry.columns]
+    )
+
+    dtypes = {}
+    for channel in telemetry.columns:
+        values = telemetry[channel]
+        if channel == "Source":
+            dtypes[channel] = SOURCES
+        elif channel == "Status":
+            dtypes[channel] = "category"
+        elif channel == "Brake" and not values.hasnans:
+            dtypes[channel] = bool
+        elif not is_bool_dtype(values.dtype) and (
+            is_integer_dtype(values.dtype) or is_float_dtype(values.dtype)
+        ):
+            dtypes[channel] = _compact_dtype(values)
+
+    return telemetry.astype(dtypes)
+
+
+def with_continuous_floats(telemetry: Telemetry) -> Telemetry:
+    """Telemetry with its continuous channels as floats again, as merging telemetry casts
+    the interpolated samples back to the dtypes of the channels"""
+    dtypes = {
+        channel: float64
+        for channel in CONTINUOUS_CHANNELS
+        if channel in telemetry.columns and telemetry[channel].dtype != float64
+    }
+    return telemetry.astype(dtypes) if dtypes else telemetry
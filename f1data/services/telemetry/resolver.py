@@ -1,43 +1,126 @@
+from functools import partial
 from math import pi
 from typing import Sequence
 
+from fastapi import HTTPException
 from numpy import (
-    concatenate,
+    arange,
+    column_stack,
     cos,
+    flatnonzero,
     interp,
     array,
+    linspace,
     matmul,
+    minimum,
+    ones,
     sin,
     min as np_min,
-    max as np_max,
-    stack,
 )
-from core.models.queries import SessionIdentifier, TelemetryRequest
+from core.config import TELEMETRY_FAN_OUT
+from core.models.queries import (
+    DownsamplingMode,
+    SessionIdentifier,
+    TelemetryChannel,
+    TelemetryRequest,
+)
+from services.session.executor import loader_executor
 from services.session.registry import get_loader
-from services.session.session import SessionLoader 
-from pandas import DataFrame, Series, concat
-from fastf1.core import Telemetry, Laps
+from services.session.session import SessionLoader
+from services.telemetry.cache import LapTelemetry, slice_driver_laps
+from services.telemetry.comparison import LapComparison, grid_points, lap_progress
+from services.telemetry.downsampling import downsample
+from pandas import DataFrame, concat
+from fastf1.core import Laps
+
+# amount of position samples per minisector when the fastest drivers are bucketed
+MINISECTOR_RESOLUTION = 10
+
+# response channel names mapped to the names of the telemetry channels,
+# in the field order of `TelemetryData`
+TELEMETRY_CHANNELS = {
+    TelemetryChannel.THROTTLE: "Throttle",
+    TelemetryChannel.BRAKE: "Brake",
+    TelemetryChannel.GEAR: "nGear",
+    TelemetryChannel.SPEED: "Speed",
+    TelemetryChannel.RPM: "RPM",
+    TelemetryChannel.TIME: "Time",
+    TelemetryChannel.RELATIVE_DISTANCE: "RelativeDistance",
+    TelemetryChannel.DISTANCE: "Distance",
+}
+
+# channels that can not be interpolated when telemetry is downsampled
+DISCRETE_CHANNELS = ("Brake", "nGear")
 
-from utils.get_driver_color import get_driver_style
 
+async def _pick_lap_telemetries(
+    loader: SessionLoader, laps: Laps, keys: Sequence[tuple[str, int]]
+) -> list[LapTelemetry]:
+    cache = loader.lap_telemetry_cache
+    telemetries = cache.lookup(keys)
+
+    missing: dict[str, list[int]] = {}
+    for driver, lap in keys:
+        if (driver, lap) not in telemetries:
+            missing.setdefault(driver, []).append(lap)
+
+    jobs = [
+        partial(slice_driver_laps, laps, driver, lap_numbers)
+        for driver, lap_numbers in missing.items()
+    ]
+    sliced = (
+        await loader_executor.map(jobs) if TELEMETRY_FAN_OUT else [job() for job in jobs]
+    )
+    for driver, driver_telemetries in zip(missing, sliced):
+        for lap, telemetry in driver_telemetries.items():
+            telemetries[(driver, lap)] = telemetry
+            cache.put((driver, lap), telemetry)
+
+    return [telemetries[key] for key in keys]
+
+
+def _resolve_driver_telemetry(
+    loader: SessionLoader,
+    driver: str,
+    telemetry: LapTelemetry,
+    channels: Sequence[TelemetryChannel] | None,
+    points: int | None,
+    mode: DownsamplingMode,
+):
+    names = [name for name in TELEMETRY_CHANNELS if not channels or name in channels]
+    values = {
+        TELEMETRY_CHANNELS[name]: telemetry[TELEMETRY_CHANNELS[name]] for name in names
+    }
+    if points:
+        values = downsample(
+            {"Distance": telemetry["Distance"], "Speed": telemetry["Speed"], **values},
+            points,
+            mode,
+            discrete=DISCRETE_CHANNELS,
+        )
 
-def _pick_laps_telemetry(
-    laps: Laps, lap_filter: Sequence[int] | int | str, driver: str
-) -> Telemetry:
-    lap_filter = int(lap_filter) if isinstance(lap_filter, str) else lap_filter
-    return laps.pick_drivers(driver).pick_laps(lap_filter).get_telemetry()
+    driver_style = loader.get_driver_style(driver)
+    return {
+        "driver": driver,
+        "color": driver_style["Color"],
+        "alternative_style": driver_style["IsDashed"],
+        "telemetry": {name: values[TELEMETRY_CHANNELS[name]] for name in names},
+    }
 
 
 async def generate_circuit_data(
     loader: SessionLoader,
-    reference_telemetry: Telemetry,
-    reference_driver: str,
-    laps: Laps,
-    comparison_laps: Sequence[DataFrame],
+    comparison: LapComparison,
+    reference: int,
+    reference_telemetry: LapTelemetry,
+    drivers: Sequence[str],
+    minisectors: int | None = None,
+    points: int | None = None,
+    mode: DownsamplingMode = DownsamplingMode.UNIFORM,
 ):
     circuit_data = await loader.circuit_info
     mirrored_coordinates = matmul(
-        reference_telemetry.loc[:, ("X", "Y")].to_numpy(),
+        column_stack([reference_telemetry["X"], reference_telemetry["Y"]]),
         array(
             [
                 [1, 0],
@@ -56,141 +139,154 @@ async def generate_circuit_data(
         ),
     )
 
-    reference_telemetry["X"] = rotated_coordinates[:, 0] - np_min(
-        rotated_coordinates[:, 0]
-    )
-    reference_telemetry["Y"] = rotated_coordinates[:, 1] - np_min(
-        rotated_coordinates[:, 1]
-    )
+    # the track is drawn along the reference lap. Minisectors are drawn with a fixed amount
+    # of points each, the laps are still compared on the full grid
+    if minisectors:
+        grid = linspace(0, 1, minisectors * MINISECTOR_RESOLUTION + 1)
+        minisector_index = minimum(
+            arange(len(grid)) // MINISECTOR_RESOLUTION, minisectors - 1
+        )
+        fastest_driver_index = comparison.fastest(minisectors)[minisector_index]
+    else:
+        grid = comparison.grid
+        fastest_driver_index = comparison.fastest()
 
-    driver_speed_interp_data = []
+    progress = lap_progress(reference_telemetry["Distance"])
+    position_data = {
+        "Distance": interp(grid, comparison.grid, comparison.distance(reference)),
+        "RelativeDistance": grid,
+        "X": interp(grid, progress, rotated_coordinates[:, 0])
+        - np_min(rotated_coordinates[:, 0]),
+        "Y": interp(grid, progress, rotated_coordinates[:, 1])
+        - np_min(rotated_coordinates[:, 1]),
+    }
 
-    for cmp_lap in comparison_laps.iterrows():
-        comp = _pick_laps_telemetry(laps, cmp_lap[1]["LapNumber"], cmp_lap[1]["Driver"])
-        driver_speed_interp_data.append(
+    if points and not minisectors:
+        position_data = downsample(
             {
-                "speed": interp(
-                    x=reference_telemetry["RelativeDistance"],
-                    xp=comp["RelativeDistance"],
-                    fp=comp["Speed"],
-                ),
-                "driver": cmp_lap[1]["Driver"],
-            }
+                **position_data,
+                "Speed": comparison["Speed"][reference],
+                "FastestDriverIndex": fastest_driver_index,
+            },
+            points,
+            mode,
+            discrete=("FastestDriverIndex",),
         )
+        fastest_driver_index = position_data.pop("FastestDriverIndex")
+        del position_data["Speed"]
+    position_data = DataFrame(position_data)
+
+    position_data["FastestDriver"] = array(drivers)[fastest_driver_index]
 
-    driver_speed_interp_data.append(
-        {
-            "driver": reference_driver,
-            "speed": reference_telemetry["Speed"].to_numpy(),
-        }
+    driver_styles = {driver: loader.get_driver_style(driver) for driver in set(drivers)}
+    position_data["Color"] = position_data["FastestDriver"].map(
+        {driver: style["Color"] for driver, style in driver_styles.items()}
     )
-    fastest_driver_series = []
-
-    for i in range(len(driver_speed_interp_data[0]["speed"])):
-        speeds = stack([item["speed"] for item in driver_speed_interp_data], axis=-1)
-        for driver_speeds in speeds:
-            max_speed = np_max(driver_speeds)
-            for data in driver_speed_interp_data:
-                if data["speed"][i] == max_speed:
-                    fastest_driver_series.append(data["driver"])
-                    break
-
-    reference_telemetry["FastestDriver"] = Series(fastest_driver_series)
-
-    reference_telemetry[["AlternativeStyle", "Color"]] = reference_telemetry[
-        "FastestDriver"
-    ].transform(
-        {
-            "AlternativeStyle": lambda drv: get_driver_style(drv, loader._session)[
-                "IsDashed"
-            ],
-            "Color": lambda drv: get_driver_style(drv, loader._session)["Color"],
-        }
+    position_data["AlternativeStyle"] = position_data["FastestDriver"].map(
+        {driver: style["IsDashed"] for driver, style in driver_styles.items()}
     )
     return {
-        "position_data": reference_telemetry[
+        "position_data": position_data[
             [
-                "Distance",
-                "RelativeDistance",
                 "X",
                 "Y",
+                "Distance",
+                "RelativeDistance",
                 "FastestDriver",
                 "Color",
                 "AlternativeStyle",
             ]
-        ].to_dict(orient="records"),
-        "rotation": circuit_data.rotation,
+        ],
+        "rotation": float(circuit_data.rotation),
     }
 
 
+def _reference_index(laps: Laps, driver: str | None, lap: int | None) -> int:
+    """Position of the reference lap among the compared laps. The fastest of the compared laps,
+    or of the laps of the given driver, unless a lap is picked"""
+    candidates = ones(len(laps), dtype=bool)
+    if driver is not None:
+        candidates &= (laps["Driver"] == driver).to_numpy()
+    if lap is not None:
+        candidates &= (laps["LapNumber"] == lap).to_numpy()
+    if not candidates.any():
+        raise HTTPException(
+            status_code=400, detail="The reference lap is not one of the compared laps"
+        )
+
+    lap_times = laps["LapTime"].reset_index(drop=True).where(candidates)
+    if lap_times.isna().all():
+        return int(flatnonzero(candidates)[0])
+    return int(lap_times.idxmin())
+
+
 async def get_interpolated_telemetry_comparison(
     year: str,
     round_number: int,
     session_identifier: SessionIdentifier | int,
     comparison: list[TelemetryRequest],
     is_testing: bool,
+    minisectors: int | None = None,
+    points: int | None = None,
+    mode: DownsamplingMode = DownsamplingMode.UNIFORM,
+    reference_driver: str | None = None,
+    reference_lap: int | None = None,
 ):
     loader = get_loader(year, round_number, session_identifier, is_testing)
     laps = await loader.lap_telemetry
-    telemetries = []
     concat_laps = concat(
         [laps.pick_drivers(req.driver).pick_laps(req.lap_filter) for req in comparison]
     )
-    reference_laptime = concat_laps["LapTime"].min()
-
-    reference_lap = concat_laps.loc[concat_laps["LapTime"] == reference_laptime]
-    comparison_laps = concat_laps.loc[concat_laps["LapTime"] != reference_laptime]
+    reference = _reference_index(concat_laps, reference_driver, reference_lap)
+    keys = [
+        (driver, int(lap_number))
+        for driver, lap_number in zip(concat_laps["Driver"], concat_laps["LapNumber"])
+    ]
+    drivers = [driver for driver, _ in keys]
+    telemetries = await _pick_lap_telemetries(loader, laps, keys)
 
-    # interpolate reference data
-    driver_name = reference_lap["Driver"].iloc[0]
-    reference_telemetry = _pick_laps_telemetry(
-        laps, reference_lap["LapNumber"].iloc[0], driver_name
-    )
+    # every lap is resampled once, gaps and speeds are rows of the resampled channels
+    lap_comparison = LapComparison(telemetries, grid_points(minisectors))
     circuit_data = await generate_circuit_data(
-        loader, reference_telemetry, driver_name, laps, comparison_laps
+        loader,
+        lap_comparison,
+        reference,
+        telemetries[reference],
+        drivers,
+        minisectors,
+        points,
+        mode,
     )
 
-    reference_distance = reference_telemetry["Distance"].iat[-1]
+    distance = lap_comparison.distance(reference)
+    gaps = lap_comparison.gaps(reference)
+    speeds = lap_comparison["Speed"]
+    comparisons = []
+    for index, (driver, lap_number) in enumerate(keys):
+        if index == reference:
+            continue
 
-    def interpolate_bounds(channel):
-        channel_start = channel[1] - channel[0]
-        channel_end = channel[-1] - channel[-2]
-        return concatenate(
-            [[channel[0] - channel_start], channel, [channel[-1] + channel_end]]
-        )
-
-    # interpolate comparison data
-    for cmp_lap in comparison_laps.iterrows():
-        driver_telemetry = _pick_laps_telemetry(
-            laps, cmp_lap[1]["LapNumber"], cmp_lap[1]["Driver"]
-        )
-        q = driver_telemetry["Distance"].iat[-1] / reference_distance
-        lattice_distance = (
-            interpolate_bounds(driver_telemetry["Distance"].to_numpy()) * q
-        )
-        lattice_time = interpolate_bounds(
-            driver_telemetry["Time"].dt.total_seconds().to_numpy()
-        )
-        laptime_seq = interp(
-            reference_telemetry["Distance"], lattice_distance, lattice_time
-        )
-        delta = laptime_seq - reference_telemetry["Time"].dt.total_seconds()
-        driver = cmp_lap[1]["Driver"]
-        driver_style = get_driver_style(driver, loader._session)
-        telemetries.append(
+        values = {"Distance": distance, "Gap": gaps[index], "Speed": speeds[index]}
+        if points:
+            values = downsample(values, points, mode, y="Gap")
+        driver_style = loader.get_driver_style(driver)
+        comparisons.append(
             {
                 "driver": driver,
+                "lap": lap_number,
                 "color": driver_style["Color"],
                 "alternative_style": driver_style["IsDashed"],
                 "comparison": {
-                    "gap": delta.tolist(),
-                    "distance": lattice_distance.tolist(),
+                    "distance": values["Distance"],
+                    "gap": values["Gap"],
+                    "speed": values["Speed"],
                 },
             }
         )
     return {
-        "telemetries": telemetries,
-        "reference": reference_lap["Driver"].iloc[0],
+        "reference": drivers[reference],
+        "reference_lap": keys[reference][1],
+        "telemetries": comparisons,
         "circuit_data": circuit_data,
     }
 
@@ -202,6 +298,9 @@ async def get_telemetry(
     driver: str,
     lap: str,
     is_testing: bool,
+    channels: Sequence[TelemetryChannel] | None = None,
+    points: int | None = None,
+    mode: DownsamplingMode = DownsamplingMode.UNIFORM,
 ):
     loader = get_loader(
         year=year,
@@ -209,25 +308,12 @@ async def get_telemetry(
         session_identifier=session_identifier,
         is_testing=is_testing,
     )
-    telemetry = _pick_laps_telemetry(await loader.lap_telemetry, lap, driver)[
-        [
-            "Throttle",
-            "Brake",
-            "nGear",
-            "Speed",
-            "RPM",
-            "RelativeDistance",
-            "Distance",
-            "Time",
-        ]
-    ]
-    driver_style = get_driver_style(driver, loader._session)
-    return {
-        "driver": driver,
-        "color": driver_style["Color"],
-        "alternative_style": driver_style["IsDashed"],
-        "telemetry": telemetry.rename(columns={"nGear": "Gear"}).to_dict(orient="list"),
-    }
+    [telemetry] = await _pick_lap_telemetries(
+        loader, await loader.lap_telemetry, [(driver, int(lap))]
+    )
+    return _resolve_driver_telemetry(
+        loader, driver, telemetry, channels, points, mode
+    )
 
 
 async def get_telemetries(
@@ -236,19 +322,19 @@ async def get_telemetries(
     session_identifier: SessionIdentifier | int,
     is_testing: bool,
     queries: list[TelemetryRequest],
+    channels: Sequence[TelemetryChannel] | None = None,
+    points: int | None = None,
+    mode: DownsamplingMode = DownsamplingMode.UNIFORM,
 ):
-    telemetries = []
-    for query in queries:
-        for lap in query.lap_filter:
-            telemetries.append(
-                await get_telemetry(
-                    year,
-                    round_number,
-                    session_identifier,
-                    query.driver,
-                    str(lap),
-                    is_testing=is_testing,
-                )
-            )
-
-    return telemetries
+    loader = get_loader(
+        year=year,
+        round=round_number,
+        session_identifier=session_identifier,
+        is_testing=is_testing,
+    )
+    keys = [(query.driver, lap) for query in queries for lap in query.lap_filter]
+    telemetries = await _pick_lap_telemetries(loader, await loader.lap_telemetry, keys)
+    return [
+        _resolve_driver_telemetry(loader, driver, telemetry, channels, points, mode)
+        for (driver, _), telemetry in zip(keys, telemetries)
+    ]
@@ -0,0 +1,76 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+IDENTITY = "identity"
+GZIP = "gzip"
+BROTLI = "br"
+ZSTD = "zstd"
+
+
+def supported_encodings() -> list[str]:
+    """Content encodings that can be produced, in the order of preference of the server"""
+    encodings = []
+    if brotli is not None:
+        encodings.append(BROTLI)
+    if zstandard is not None:
+        encodings.append(ZSTD)
+    encodings.append(GZIP)
+    return encodings
+
+
+def negotiate_content_encoding(accept_encoding: str | None) -> str:
+    """Picks the supported content encoding the client prefers, equally preferred encodings
+    are picked in the order of preference of the server. Falls back to identity"""
+    if not accept_encoding:
+        return IDENTITY
+
+    qualities: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, *parameters = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+
+    wildcard = qualities.get("*", 0.0)
+    candidates = [
+        (-qualities.get(encoding, wildcard), position, encoding)
+        for position, encoding in enumerate(supported_encodings())
+    ]
+    quality, _, encoding = min(candidates)
+    return encoding if quality < 0 else IDENTITY
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == GZIP:
+        # without a timestamp equal bodies compress to equal bytes
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=5)
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=6).compress(body)
+    return body
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    if encoding == GZIP:
+        return gzip.decompress(body)
+    if encoding == BROTLI:
+        return brotli.decompress(body)
+    if encoding == ZSTD:
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
@@ -0,0 +1,220 @@
+import json
+from functools import cache
+from typing import Any, Mapping, Sequence
+
+from fastapi import Response
+from numpy import float32, float64, generic, isnan, ndarray
+from pandas import DataFrame
+from pydantic import TypeAdapter
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+MEDIA_TYPE_ALIASES = {
+    "*/*": JSON_MEDIA_TYPE,
+    "application/*": JSON_MEDIA_TYPE,
+    "application/x-msgpack": MSGPACK_MEDIA_TYPE,
+}
+
+
+def negotiate_media_type(accept: str | None, supported: Sequence[str]) -> str:
+    """Picks the supported media type the client prefers, JSON is the fallback"""
+    if not accept:
+        return JSON_MEDIA_TYPE
+
+    candidates = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, *parameters = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        candidates.append((-quality, position, media_type.lower()))
+
+    for quality, _, media_type in sorted(candidates):
+        media_type = MEDIA_TYPE_ALIASES.get(media_type, media_type)
+        if quality < 0 and (media_type == JSON_MEDIA_TYPE or media_type in supported):
+            return media_type
+
+    return JSON_MEDIA_TYPE
+
+
+def _compact(values: ndarray) -> ndarray:
+    # binary formats transfer floats with single precision, which is what the telemetry
+    # is stored with in the first place
+    return values.astype(float32) if values.dtype == float64 else values
+
+
+def to_nullable_list(values: ndarray, missing: ndarray) -> list:
+    """Converts the array to a list of native values with None in place of missing ones"""
+    if not missing.any():
+        return values.tolist()
+
+    objects = values.astype(object)
+    objects[missing] = None
+    return objects.tolist()
+
+
+def _array_to_list(values: ndarray) -> list:
+    # NaN is not valid JSON, the response models serialize it as null
+    if values.dtype.kind == "f":
+        return to_nullable_list(values, isnan(values))
+    return values.tolist()
+
+
+def to_json_compatible(payload: Any) -> Any:
+    if isinstance(payload, ndarray):
+        return _array_to_list(payload)
+    if isinstance(payload, DataFrame):
+        columns = [_array_to_list(payload[column].to_numpy()) for column in payload]
+        return [dict(zip(payload.columns, row)) for row in zip(*columns)]
+    if isinstance(payload, Mapping):
+        return {key: to_json_compatible(value) for key, value in payload.items()}
+    if isinstance(payload, list):
+        return [to_json_compatible(value) for value in payload]
+    return payload
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, ndarray):
+        if value.dtype.kind not in "biuf":
+            return value.tolist()
+        values = _compact(value)
+        return {
+            "dtype": values.dtype.str,
+            "shape": list(values.shape),
+            "data": values.tobytes(),
+        }
+    if isinstance(value, DataFrame):
+        return {column: value[column].to_numpy() for column in value.columns}
+    if isinstance(value, generic):
+        return value.item()
+    raise TypeError(f"Can not encode {type(value)} as MessagePack")
+
+
+def encode_msgpack(payload: Any) -> bytes:
+    """Numeric arrays are encoded as maps holding the dtype, the shape and the raw buffer"""
+    return msgpack.packb(payload, default=_msgpack_default)
+
+
+def encode_arrow(telemetries: Sequence[Mapping[str, Any]]) -> bytes:
+    """Encodes telemetry of laps as an Arrow IPC stream with a record batch per lap,
+    the remaining fields of every lap are stored in the metadata of its batch"""
+    batches = [
+        (
+            pyarrow.record_batch(
+                {
+                    channel: pyarrow.array(_compact(values))
+                    for channel, values in telemetry["telemetry"].items()
+                }
+            ),
+            {
+                key: json.dumps(value)
+                for key, value in telemetry.items()
+                if key != "telemetry"
+            },
+        )
+        for telemetry in telemetries
+    ]
+    schema = batches[0][0].schema if batches else pyarrow.schema([])
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for batch, metadata in batches:
+            writer.write_batch(batch, custom_metadata=metadata)
+
+    return sink.getvalue().to_pybytes()
+
+
+def encode_json(content: Any) -> bytes:
+    """Renders JSON compatible content exactly like `JSONResponse` does"""
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def json_response(content: Any, headers: Mapping[str, str]) -> Response:
+    """Responds with content that is already JSON compatible, skipping the validation and
+    serialization of the response model.
+
+    The content has to follow the field order of the response model"""
+    return Response(
+        content=encode_json(content), media_type=JSON_MEDIA_TYPE, headers=dict(headers)
+    )
+
+
+@cache
+def _type_adapter(model_type: Any) -> TypeAdapter:
+    return TypeAdapter(model_type)
+
+
+def encode_model(model_type: Any, content: Any) -> bytes:
+    """Validates and renders the content with the response model the way
+    the routes serialize their return values"""
+    adapter = _type_adapter(model_type)
+    return encode_json(
+        adapter.dump_python(
+            adapter.validate_python(content, from_attributes=True),
+            mode="json",
+            by_alias=True,
+        )
+    )
+
+
+def model_response(model_type: Any, content: Any, headers: Mapping[str, str]) -> Response:
+    return Response(
+        content=encode_model(model_type, content),
+        media_type=JSON_MEDIA_TYPE,
+        headers=dict(headers),
+    )
+
+
+def response_media_type(accept: str | None, tabular: bool = False) -> str:
+    """Media type `encode_response` encodes the payload with for the `Accept` header.
+
+    Only `tabular` payloads, i.e. lists of lap telemetry, can be encoded with Arrow"""
+    supported = []
+    if msgpack is not None:
+        supported.append(MSGPACK_MEDIA_TYPE)
+    if pyarrow is not None and tabular:
+        supported.append(ARROW_MEDIA_TYPE)
+
+    return negotiate_media_type(accept, supported)
+
+
+def encode_response(
+    accept: str | None,
+    payload: Any,
+    headers: Mapping[str, str],
+    tabular: bool = False,
+) -> Response:
+    """Encodes the payload into the format negotiated through the `Accept` header,
+    JSON is rendered directly from the arrays of the payload"""
+    media_type = response_media_type(accept, tabular)
+    if media_type == JSON_MEDIA_TYPE:
+        return json_response(to_json_compatible(payload), headers)
+
+    content = (
+        encode_msgpack(payload)
+        if media_type == MSGPACK_MEDIA_TYPE
+        else encode_arrow(payload if isinstance(payload, list) else [payload])
+    )
+    return Response(content=content, media_type=media_type, headers=dict(headers))
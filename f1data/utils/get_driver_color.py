@@ -12,4 +12,16 @@ STYLE_PRESET = [
 
 def get_driver_style(driver: str, session: Session) -> DriverStyle:
     style = ff1_get_driver_style(driver, STYLE_PRESET, session)
-    return {"Color": style["color"], "IsDashed": style["linestyle"] == "dashed"}
\ No newline at end of file
+    return {"Color": style["color"], "IsDashed": style["linestyle"] == "dashed"}
+
+
+def get_driver_styles(session: Session) -> dict[str, DriverStyle]:
+    """Resolves the styles of every driver taking part in the session, keyed by abbreviation"""
+    styles = {}
+    for driver in session.results["Abbreviation"].dropna().unique():
+        try:
+            styles[driver] = get_driver_style(driver, session)
+        except (KeyError, ValueError):
+            continue
+
+    return styles
\ No newline at end of file
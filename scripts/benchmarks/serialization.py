@@ -0,0 +1,233 @@
+"""Compares the response model serialization of lap and telemetry responses with the
+columnar serialization the routes use, on a synthetic race sized session.
+
+Run from the repository root: `python -m scripts.benchmarks.serialization`"""
+
+import asyncio
+import sys
+import warnings
+from pathlib import Path
+from timeit import repeat
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from fastf1.core import Laps
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "f1data"))
+
+from core.models.queries import SessionQuery  # noqa: E402
+from services.laps import resolver  # noqa: E402
+from services.laps.models.laps import (  # noqa: E402
+    DriverLapData,
+    LapSelectionData,
+    StintData,
+)
+from services.laps.table import LapTable  # noqa: E402
+from services.telemetry.cache import LapTelemetry  # noqa: E402
+from services.telemetry.models.Telemetry import DriverTelemetryData  # noqa: E402
+from services.telemetry.resolver import _resolve_driver_telemetry  # noqa: E402
+from utils.encoding import encode_json, to_json_compatible  # noqa: E402
+
+DRIVERS = 20
+LAPS = 58
+TELEMETRY_SAMPLES = 750
+LAPS_PER_TELEMETRY_REQUEST = 10
+ROUNDS = 5
+
+
+class Loader:
+    def get_driver_style(self, driver: str):
+        return {"Color": "#ff8000", "IsDashed": driver.endswith("1")}
+
+
+def make_laps(rng: np.random.Generator) -> Laps:
+    rows = DRIVERS * LAPS
+    drivers = np.repeat([f"D{number:02}" for number in range(DRIVERS)], LAPS)
+    lap_numbers = np.tile(np.arange(1, LAPS + 1), DRIVERS).astype(float)
+    stints = np.where(lap_numbers < 20, 1.0, np.where(lap_numbers < 40, 2.0, 3.0))
+    sectors = [
+        pd.to_timedelta(rng.integers(25_000, 35_000, rows), unit="ms")
+        for _ in range(3)
+    ]
+    out_laps = np.isin(lap_numbers, [1, 20, 40])
+    in_laps = np.isin(lap_numbers, [19, 39])
+    sectors[0] = sectors[0].where(~out_laps)
+    sectors[2] = sectors[2].where(~in_laps)
+
+    def speeds():
+        values = rng.integers(2500, 3400, rows) / 10
+        values[rng.random(rows) < 0.02] = np.nan
+        return values
+
+    compounds = np.array(["SOFT", "MEDIUM", "HARD"], dtype=object)[
+        stints.astype(int) - 1
+    ]
+    compounds[rng.random(rows) < 0.01] = np.nan
+    return Laps(
+        {
+            "Driver": drivers,
+            "DriverNumber": np.repeat([str(number) for number in range(DRIVERS)], LAPS),
+            "Team": np.repeat([f"Team {number // 2}" for number in range(DRIVERS)], LAPS),
+            "LapTime": sectors[0] + sectors[1] + sectors[2],
+            "Sector1Time": sectors[0],
+            "Sector2Time": sectors[1],
+            "Sector3Time": sectors[2],
+            "SpeedI1": speeds(),
+            "SpeedI2": speeds(),
+            "SpeedFL": speeds(),
+            "Stint": stints,
+            "TyreLife": lap_numbers - np.array([0, 19, 39])[stints.astype(int) - 1],
+            "Position": rng.integers(1, DRIVERS + 1, rows).astype(float),
+            "Compound": compounds,
+            "PitInTime": pd.to_timedelta(np.where(in_laps, 1.0, np.nan), unit="s"),
+            "PitOutTime": pd.to_timedelta(np.where(out_laps, 1.0, np.nan), unit="s"),
+            "LapNumber": lap_numbers,
+            # a safety car period from the end of lap 29 to the start of lap 32
+            "TrackStatus": np.where(
+                np.isin(lap_numbers, [29, 32]),
+                "14",
+                np.where(np.isin(lap_numbers, [30, 31]), "4", "1"),
+            ),
+        }
+    )
+
+
+def make_telemetry(rng: np.random.Generator) -> LapTelemetry:
+    distance = np.sort(rng.random(TELEMETRY_SAMPLES)) * 5000
+    return LapTelemetry.from_telemetry(
+        pd.DataFrame(
+            {
+                "Speed": rng.random(TELEMETRY_SAMPLES) * 330,
+                "Throttle": rng.random(TELEMETRY_SAMPLES) * 100,
+                "RPM": rng.random(TELEMETRY_SAMPLES) * 12000,
+                "Distance": distance,
+                "RelativeDistance": distance / distance[-1],
+                "Time": pd.to_timedelta(distance / 60, unit="s"),
+                "X": rng.random(TELEMETRY_SAMPLES) * 1000,
+                "Y": rng.random(TELEMETRY_SAMPLES) * 1000,
+                "Brake": rng.random(TELEMETRY_SAMPLES) < 0.2,
+                "nGear": rng.integers(1, 9, TELEMETRY_SAMPLES),
+            }
+        )
+    )
+
+
+def resolve_lap_models(loader, populated_laps: pd.DataFrame) -> LapSelectionData:
+    """Builds the response models the way the laps were serialized before"""
+    populated_laps.set_index(["Driver", "Team"], inplace=True)
+
+    lap_data = []
+    for index in populated_laps.index.unique():
+        driver_laps = populated_laps.loc[[index]]
+        flying_laps = driver_laps[driver_laps["IsFlyingLap"]]
+        stints = flying_laps.groupby("Stint").agg(
+            avg_time=pd.NamedAgg(column="LapTime", aggfunc="mean"),
+            min_time=pd.NamedAgg(column="LapTime", aggfunc="min"),
+            max_time=pd.NamedAgg(column="LapTime", aggfunc="max"),
+            low_quartile=pd.NamedAgg(
+                column="LapTime", aggfunc=lambda x: x.quantile(0.25)
+            ),
+            high_quartile=pd.NamedAgg(
+                column="LapTime", aggfunc=lambda x: x.quantile(0.75)
+            ),
+            median=pd.NamedAgg(column="LapTime", aggfunc=lambda x: x.median()),
+            total_laps=pd.NamedAgg(column="LapTime", aggfunc="count"),
+        )
+        style = loader.get_driver_style(index[0])
+        lap_data.append(
+            DriverLapData(
+                driver=index[0],
+                team=index[1],
+                color=style["Color"],
+                alternative_style=style["IsDashed"],
+                stints=stints.to_dict(orient="records"),
+                session_data=StintData(
+                    total_laps=len(driver_laps),
+                    avg_time=flying_laps["LapTime"].mean(),
+                    min_time=driver_laps["LapTime"].min(),
+                    max_time=driver_laps["LapTime"].max(),
+                    low_quartile=driver_laps["LapTime"].quantile(0.25),
+                    high_quartile=driver_laps["LapTime"].quantile(0.75),
+                    median=flying_laps["LapTime"].median(),
+                ),
+                laps=driver_laps.to_dict(orient="records"),
+            )
+        )
+
+    lap_data.sort(key=lambda x: x.session_data.min_time)
+    flying_laps = populated_laps[populated_laps["IsFlyingLap"]]
+    return LapSelectionData(
+        driver_lap_data=lap_data,
+        low_decile=flying_laps["LapTime"].quantile(0.1),
+        high_decile=flying_laps["LapTime"].quantile(0.9),
+        min_time=populated_laps["LapTime"].min(),
+        max_time=populated_laps["LapTime"].max(),
+        data_version=0,
+    )
+
+
+def render_model(model_type, content, exclude_none=False) -> bytes:
+    field = create_model_field(name="Response", type_=model_type, mode="serialization")
+    serialized = asyncio.run(
+        serialize_response(
+            field=field, response_content=content, exclude_none=exclude_none
+        )
+    )
+    return JSONResponse(serialized).body
+
+
+def benchmark(name: str, model_path, columnar_path) -> None:
+    model_body, columnar_body = model_path(), columnar_path()
+    if model_body != columnar_body:
+        raise AssertionError(f"{name}: the serialized responses differ")
+
+    model_time = min(repeat(model_path, number=1, repeat=ROUNDS))
+    columnar_time = min(repeat(columnar_path, number=1, repeat=ROUNDS))
+    print(
+        f"{name}: {len(columnar_body) / 1024:.0f} KiB, "
+        f"response model {model_time * 1000:.1f} ms, "
+        f"columnar {columnar_time * 1000:.1f} ms, "
+        f"{model_time / columnar_time:.1f}x faster"
+    )
+
+
+def main() -> None:
+    warnings.simplefilter("ignore")
+    rng = np.random.default_rng(0)
+    loader = Loader()
+
+    laps = make_laps(rng)
+    queries = [
+        SessionQuery(driver=driver, lap_filter=None) for driver in laps["Driver"].unique()
+    ]
+    flagged_laps = LapTable(laps).laps
+    benchmark(
+        "laps",
+        lambda: render_model(
+            LapSelectionData, resolve_lap_models(loader, flagged_laps.copy())
+        ),
+        lambda: encode_json(resolver._resolve_lap_data(loader, LapTable(laps), queries)),
+    )
+
+    telemetries = [
+        _resolve_driver_telemetry(
+            loader, f"D{number:02}", make_telemetry(rng), None, None, "uniform"
+        )
+        for number in range(LAPS_PER_TELEMETRY_REQUEST)
+    ]
+    benchmark(
+        "telemetries",
+        lambda: render_model(
+            list[DriverTelemetryData],
+            to_json_compatible(telemetries),
+            exclude_none=True,
+        ),
+        lambda: encode_json(to_json_compatible(telemetries)),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compares the per driver lambda aggregations that used to build the stint statistics
+with the grouped pass of the lap table, on a synthetic race sized session.
+
+Run from the repository root: `python -m scripts.benchmarks.statistics`"""
+
+import warnings
+from timeit import repeat
+
+import numpy as np
+import pandas as pd
+
+# importing the serialization benchmark makes the services importable
+from scripts.benchmarks.serialization import ROUNDS, make_laps
+from services.laps.serialization import (
+    STINT_FIELDS,
+    serialize_records,
+    timedelta_to_seconds,
+)
+from services.laps.table import LapTable, driver_statistics
+
+
+def aggregate_driver_statistics(laps: pd.DataFrame) -> dict:
+    """The statistics the way they were computed before the grouped pass"""
+    statistics = {}
+    for index, driver_laps in laps.groupby(["Driver", "Team"], sort=False):
+        flying_laps = driver_laps[driver_laps["IsFlyingLap"]]
+        stints = flying_laps.groupby("Stint").agg(
+            avg_time=pd.NamedAgg(column="LapTime", aggfunc="mean"),
+            min_time=pd.NamedAgg(column="LapTime", aggfunc="min"),
+            max_time=pd.NamedAgg(column="LapTime", aggfunc="max"),
+            low_quartile=pd.NamedAgg(
+                column="LapTime", aggfunc=lambda x: x.quantile(0.25)
+            ),
+            high_quartile=pd.NamedAgg(
+                column="LapTime", aggfunc=lambda x: x.quantile(0.75)
+            ),
+            median=pd.NamedAgg(column="LapTime", aggfunc=lambda x: x.median()),
+            total_laps=pd.NamedAgg(column="LapTime", aggfunc="count"),
+        )
+        times = [
+            flying_laps["LapTime"].mean(),
+            driver_laps["LapTime"].min(),
+            driver_laps["LapTime"].max(),
+            flying_laps["LapTime"].median(),
+            driver_laps["LapTime"].quantile(0.25),
+            driver_laps["LapTime"].quantile(0.75),
+        ]
+        statistics[index] = (
+            {
+                "total_laps": len(driver_laps),
+                **dict(zip(list(STINT_FIELDS)[1:], timedelta_to_seconds(times))),
+            },
+            serialize_records(stints, STINT_FIELDS),
+        )
+
+    return statistics
+
+
+def main() -> None:
+    warnings.simplefilter("ignore")
+    laps = LapTable(make_laps(np.random.default_rng(0))).laps
+
+    grouped = {
+        key: (statistics.session_data, statistics.stints)
+        for key, statistics in driver_statistics(laps).items()
+    }
+    if grouped != aggregate_driver_statistics(laps):
+        raise AssertionError("the statistics differ")
+
+    for name, selection in (
+        ("session", laps),
+        ("driver", laps[laps["Driver"] == "D03"]),
+        ("filtered laps", laps[(laps["Driver"] == "D03") & (laps["LapNumber"] < 8)]),
+    ):
+        aggregated = min(
+            repeat(lambda: aggregate_driver_statistics(selection), number=1, repeat=ROUNDS)
+        )
+        single_pass = min(
+            repeat(lambda: driver_statistics(selection), number=1, repeat=ROUNDS)
+        )
+        print(
+            f"{name}: {len(selection)} laps, "
+            f"lambda aggregations {aggregated * 1000:.2f} ms, "
+            f"grouped pass {single_pass * 1000:.2f} ms, "
+            f"{aggregated / single_pass:.1f}x faster"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import asyncio
+
+from core.models.queries import SessionQuery
+from services.laps import resolver
+from services.laps.table import LapTable
+from tests.factories import make_laps
+
+
+def changed_laps(table: LapTable, since_version: int) -> dict[str, list[int]]:
+    queries = [SessionQuery(driver=driver, lap_filter=None) for driver in ("VER", "SAR")]
+    return {
+        selection.driver: [
+            record["LapNumber"] for record in table.records(selection.positions, since_version)
+        ]
+        for selection in table.select(queries)
+    }
+
+
+def test_records_since_version_include_laps_of_lapped_drivers():
+    table = LapTable(make_laps({"VER": 10, "SAR": 8}), data_version=1)
+    assert changed_laps(table, 1) == {"VER": [], "SAR": []}
+
+    table.ingest(make_laps({"VER": 11, "SAR": 9}), data_version=2)
+
+    # lap 9 of the lapped driver is numbered below the laps the leader completed before
+    assert changed_laps(table, 1) == {"VER": [11], "SAR": [9]}
+    assert changed_laps(table, 2) == {"VER": [], "SAR": []}
+    assert len(changed_laps(table, 0)["SAR"]) == 9
+
+
+def test_records_since_version_include_flag_changes_of_earlier_laps():
+    table = LapTable(make_laps({"VER": 10, "SAR": 8}), data_version=1)
+
+    # the lapped driver improves the personal best it set on lap 1 and the purple sectors
+    table.ingest(make_laps({"VER": 11, "SAR": 9}, {("SAR", 9): 80.0}), data_version=2)
+
+    changed = changed_laps(table, 1)
+    assert changed["SAR"] == [1, 9]
+    assert 1 in changed["VER"] and 11 in changed["VER"]
+
+
+def test_concurrent_requests_share_the_lap_table_build(monkeypatch):
+    builds = []
+
+    class Loader:
+        data_version = 1
+        lap_table = None
+        pending_lap_table = None
+
+        async def refresh(self):
+            pass
+
+        @property
+        async def laps(self):
+            return make_laps({"VER": 10, "SAR": 8})
+
+    def build(laps, data_version):
+        builds.append(data_version)
+        return LapTable(laps, data_version)
+
+    monkeypatch.setattr(resolver, "LapTable", build)
+    loader = Loader()
+
+    async def request_all():
+        return await asyncio.gather(*(resolver.get_lap_table(loader) for _ in range(4)))
+
+    tables = asyncio.run(request_all())
+    assert builds == [1]
+    assert all(table is loader.lap_table for table in tables)
@@ -0,0 +1,37 @@
+from core.models.queries import SessionQuery
+from services.laps.analytics import _resolve_pace_data
+from services.laps.table import LapTable
+from tests.factories import make_laps
+
+
+class Loader:
+    def __init__(self, total_laps: int | None) -> None:
+        self.total_laps = total_laps
+
+    def get_driver_style(self, driver: str):
+        return {"Color": "#ffffff", "IsDashed": False}
+
+
+def fuel_corrected_times(loader: Loader, table: LapTable, driver: str = "VER") -> list[float]:
+    pace = _resolve_pace_data(
+        loader, table, [SessionQuery(driver=driver, lap_filter=None)], fuel_correction=0.05
+    )
+    return [stint["fuel_corrected_time"] for stint in pace["driver_pace_data"][0]["stints"]]
+
+
+def test_pace_is_corrected_to_the_scheduled_distance():
+    loader = Loader(total_laps=57)
+    table = LapTable(make_laps({"VER": 10, "SAR": 8}), data_version=1)
+    before = fuel_corrected_times(loader, table, "SAR")
+
+    # the pace of the laps that were completed already does not move as the leader goes on
+    table.ingest(make_laps({"VER": 11, "SAR": 8}), data_version=2)
+    assert fuel_corrected_times(loader, table, "SAR") == before
+
+
+def test_pace_without_scheduled_distance_is_corrected_to_the_last_lap():
+    table = LapTable(make_laps({"VER": 10}), data_version=1)
+
+    assert fuel_corrected_times(Loader(total_laps=None), table) == fuel_corrected_times(
+        Loader(total_laps=10), table
+    )
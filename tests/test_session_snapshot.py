@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.session.snapshot import SessionSnapshot
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame(
+        {
+            "Speed": np.linspace(0, 330, 1000),
+            "nGear": np.ones(1000, dtype=np.int8),
+            "Source": pd.Categorical(["car", "pos"] * 500),
+            "Driver": ["VER"] * 1000,
+        }
+    )
+
+
+@pytest.fixture
+def snapshot(tmp_path, frame):
+    snapshot = SessionSnapshot(tmp_path / "2024" / "1" / "Race")
+    snapshot.write("telemetry", {"car_data.1": frame}, {"drivers": ["1"]})
+    return snapshot
+
+
+def test_restored_frames_match(snapshot, frame):
+    frames, attributes, _ = snapshot.read("telemetry")
+
+    pd.testing.assert_frame_equal(frames["car_data.1"], frame)
+    assert attributes == {"drivers": ["1"]}
+
+
+def test_copied_frames_are_not_mapped(snapshot):
+    assert snapshot.read("telemetry", writable=True).mapped_nbytes == 0
+
+
+def test_mapped_frames_count_their_numeric_columns(snapshot, frame):
+    mapped = snapshot.read("telemetry", writable=False)
+
+    expected = (
+        frame["Speed"].to_numpy().nbytes
+        + frame["nGear"].to_numpy().nbytes
+        + frame["Source"].cat.codes.to_numpy().nbytes
+    )
+    assert mapped.mapped_nbytes == expected
+
+
+def test_tiers_record_the_tiers_loaded_along_with_them(snapshot, frame):
+    snapshot.write("laps", {"_laps": frame}, {}, sources=["telemetry"])
+
+    assert snapshot.sources("laps") == {"laps", "telemetry"}
+    assert snapshot.sources("telemetry") == {"telemetry"}
+    assert snapshot.sources("weather") == set()
@@ -0,0 +1,164 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastf1.core import Laps
+
+from core.models.queries import TelemetryRequest
+from services.telemetry import resolver
+from services.telemetry.cache import CHANNELS, LapTelemetry
+from services.telemetry.comparison import LapComparison, grid_points, lap_progress
+
+DRIVERS = ("VER", "NOR", "LEC")
+LAPS_PER_DRIVER = 4
+
+
+def make_lap(rng: np.random.Generator, samples: int, length: float, lap_time: float):
+    distance = np.sort(rng.uniform(0, length, samples))
+    distance[0], distance[-1] = 3.0, length
+    speed = rng.uniform(80, 330, samples)
+    channels = {
+        "Speed": speed,
+        "Throttle": speed / 3.3,
+        "Brake": np.zeros(samples, dtype=bool),
+        "nGear": np.ones(samples),
+        "RPM": speed * 40,
+        "Distance": distance,
+        "RelativeDistance": distance / length,
+        "Time": np.linspace(0, lap_time, samples),
+        "X": np.cos(distance / length * 2 * np.pi) * 1000,
+        "Y": np.sin(distance / length * 2 * np.pi) * 1000,
+    }
+    return LapTelemetry(
+        {channel: values.astype(CHANNELS[channel][0]) for channel, values in channels.items()}
+    )
+
+
+class Circuit:
+    rotation = 90.0
+
+
+class Loader:
+    def __init__(self, laps: Laps) -> None:
+        self._laps = laps
+
+    @property
+    async def lap_telemetry(self):
+        return self._laps
+
+    @property
+    async def circuit_info(self):
+        return Circuit()
+
+    def get_driver_style(self, driver: str):
+        return {"Color": "#ffffff", "IsDashed": False}
+
+
+@pytest.fixture
+def telemetries():
+    rng = np.random.default_rng(0)
+    return [
+        make_lap(rng, 700 + index * 13, 5300 + index * 7, 90 + index * 0.3)
+        for index in range(len(DRIVERS) * LAPS_PER_DRIVER)
+    ]
+
+
+@pytest.fixture
+def comparison(monkeypatch, telemetries):
+    drivers = np.repeat(DRIVERS, LAPS_PER_DRIVER)
+    lap_numbers = np.tile(np.arange(1, LAPS_PER_DRIVER + 1), len(DRIVERS)).astype(float)
+    laps = Laps(
+        {
+            "Driver": drivers,
+            "DriverNumber": np.repeat(["1", "4", "16"], LAPS_PER_DRIVER),
+            "LapNumber": lap_numbers,
+            "LapTime": pd.to_timedelta(
+                [telemetry["Time"][-1] for telemetry in telemetries], unit="s"
+            ),
+        }
+    )
+    by_key = {
+        (driver, int(lap)): telemetry
+        for driver, lap, telemetry in zip(drivers, lap_numbers, telemetries)
+    }
+
+    async def pick_lap_telemetries(loader, laps, keys):
+        return [by_key[key] for key in keys]
+
+    monkeypatch.setattr(resolver, "get_loader", lambda *args: Loader(laps))
+    monkeypatch.setattr(resolver, "_pick_lap_telemetries", pick_lap_telemetries)
+
+    def compare(**kwargs):
+        return asyncio.run(
+            resolver.get_interpolated_telemetry_comparison(
+                "2024",
+                1,
+                "Race",
+                [
+                    TelemetryRequest(driver=driver, lap_filter=[1, 2, 3, 4])
+                    for driver in DRIVERS
+                ],
+                is_testing=False,
+                **kwargs,
+            )
+        )
+
+    return compare
+
+
+def test_channels_match_interpolation_of_every_lap(telemetries):
+    lap_comparison = LapComparison(telemetries, grid_points())
+
+    for index, telemetry in enumerate(telemetries):
+        progress = lap_progress(telemetry["Distance"])
+        for channel in ("Time", "Speed"):
+            np.testing.assert_allclose(
+                lap_comparison[channel][index],
+                np.interp(lap_comparison.grid, progress, telemetry[channel]),
+                atol=1e-9,
+            )
+
+
+def test_gaps_against_any_reference(telemetries):
+    gaps = LapComparison(telemetries, grid_points()).gaps(3)
+
+    np.testing.assert_allclose(gaps[3], 0)
+    np.testing.assert_allclose(gaps[:, 0], 0, atol=1e-9)
+    assert gaps[0, -1] == pytest.approx(telemetries[0]["Time"][-1] - telemetries[3]["Time"][-1])
+
+
+def test_reference_defaults_to_the_fastest_lap(comparison):
+    result = comparison()
+
+    assert (result["reference"], result["reference_lap"]) == ("VER", 1)
+    assert len(result["telemetries"]) == len(DRIVERS) * LAPS_PER_DRIVER - 1
+
+
+def test_reference_lap_is_picked(comparison):
+    result = comparison(reference_driver="NOR", reference_lap=3)
+
+    assert (result["reference"], result["reference_lap"]) == ("NOR", 3)
+    assert ("NOR", 3) not in {
+        (telemetry["driver"], telemetry["lap"]) for telemetry in result["telemetries"]
+    }
+
+
+def test_reference_outside_of_the_compared_laps(comparison):
+    with pytest.raises(resolver.HTTPException):
+        comparison(reference_driver="HAM")
+
+
+@pytest.mark.parametrize("points", [None, 200])
+def test_minisectors_keep_the_circuit_map_coarse(comparison, points):
+    minisectors = 25
+    result = comparison(minisectors=minisectors, points=points)
+
+    position_data = result["circuit_data"]["position_data"]
+    assert len(position_data) == minisectors * resolver.MINISECTOR_RESOLUTION + 1
+    # every minisector is won by a single driver
+    winners = position_data["FastestDriver"].to_numpy()[:-1].reshape(minisectors, -1)
+    assert (winners == winners[:, :1]).all()
+    # gaps are still compared on the full grid
+    expected = points or grid_points(minisectors)
+    assert len(result["telemetries"][0]["comparison"]["gap"]) == expected